@@ -0,0 +1,185 @@
+"""Read files straight out of Amiga .adf floppy disk images.
+An image is a plain array of 512 byte blocks. The root block sits in the
+middle of the disk and, like every directory, holds a hash table of the
+header blocks of its entries, with entries sharing a slot chained from one
+header to the next. A file header lists its data blocks (most recent
+first), continuing into extension blocks for longer files. On the old
+file system (OFS) each data block starts with a 24 byte header and holds
+488 bytes; on the fast file system (FFS) data blocks are all data.
+
+The image is memory mapped and walked in place, so Amos files can be
+converted, or just probed, without extracting them to disk first."""
+from __future__ import print_function
+import argparse
+import io
+import struct
+import sys
+from collections import namedtuple
+from AmosPy.converter import Converter, mapped_file
+from AmosPy.archives import write_conversions
+from AmosPy.probe import version_kind
+
+__author__ = 'danny'
+
+BLOCK_SIZE = 512
+HASH_TABLE_OFFSET = 24
+HASH_TABLE_SIZE = 72
+OFS_DATA_OFFSET = 24
+T_HEADER, T_LIST = 2, 16
+ST_ROOT, ST_USERDIR, ST_FILE = 1, 2, -3
+AMOS_KINDS = ('AMOS 1.3', 'AMOS Pro')
+
+longStruct = struct.Struct('>l')
+hashTableStruct = struct.Struct('>%dL' % HASH_TABLE_SIZE)
+# Fields at the end of every header block: byte size (files only), name, hash chain, parent, extension, type
+headerTailStruct = struct.Struct('>L')
+nameStruct = struct.Struct('B30s')
+chainStruct = struct.Struct('>LLLl')
+ofsDataStruct = struct.Struct('>LLLLLl')
+
+# path - the file's path in the image, with / between directories.
+# header - the block number of its file header block
+AdfEntry = namedtuple('AdfEntry', 'path size header')
+
+
+class BadAdfImage(Exception):
+    pass
+
+
+class AdfImage(object):
+    """A memory mapped adf image. Use it as a context manager, or call close"""
+    def __init__(self, filename):
+        self.filename = filename
+        self._mapping = mapped_file(filename)
+        self.buf = self._mapping.__enter__()
+        try:
+            self.blocks = len(self.buf) // BLOCK_SIZE
+            if self.buf[:3] != b'DOS' or self.blocks < 2:
+                raise BadAdfImage("%s is not an AmigaDOS disk image" % filename)
+            self.ffs = bool(struct.unpack_from('B', self.buf, 3)[0] & 1)
+            self.root = self.blocks // 2
+            if self.long(self.root, 0) != T_HEADER or self.long(self.root, BLOCK_SIZE - 4) != ST_ROOT:
+                raise BadAdfImage("No root block found at block %d of %s" % (self.root, filename))
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.buf is not None:
+            self.buf = None
+            self._mapping.__exit__(None, None, None)
+
+    def offset(self, block):
+        if not 0 < block < self.blocks:
+            raise BadAdfImage("Block %d is outside the image" % block)
+        return block * BLOCK_SIZE
+
+    def long(self, block, offset):
+        return longStruct.unpack_from(self.buf, self.offset(block) + offset)[0]
+
+    def name(self, block):
+        length, name = nameStruct.unpack_from(self.buf, self.offset(block) + BLOCK_SIZE - 80)
+        return name[:min(length, 30)].decode('latin-1')
+
+    def entries(self, directory=None, prefix='', visited=None):
+        """Yield an AdfEntry for every file, walking the directories depth first in hash table order.
+        No block is visited twice, so a directory holding one of its own ancestors can't loop,
+        and a hash chain pointing outside the image just ends there."""
+        directory = self.root if directory is None else directory
+        visited = set([directory]) if visited is None else visited
+        for first in hashTableStruct.unpack_from(self.buf, self.offset(directory) + HASH_TABLE_OFFSET):
+            block = first
+            while block and block not in visited:
+                visited.add(block)
+                try:
+                    start = self.offset(block)
+                except BadAdfImage:
+                    break
+                chain, parent, extension, secondaryType = chainStruct.unpack_from(self.buf, start + BLOCK_SIZE - 16)
+                path = prefix + self.name(block)
+                if secondaryType == ST_USERDIR:
+                    for entry in self.entries(block, path + '/', visited):
+                        yield entry
+                elif secondaryType == ST_FILE:
+                    size = headerTailStruct.unpack_from(self.buf, start + BLOCK_SIZE - 188)[0]
+                    yield AdfEntry(path, size, block)
+                block = chain
+
+    def data_blocks(self, entry):
+        """The data block numbers of a file, in order, from its header and extension blocks"""
+        blocks = []
+        block = entry.header
+        visited = set()
+        while block and block not in visited:
+            visited.add(block)
+            count = self.long(block, 8)
+            table = hashTableStruct.unpack_from(self.buf, self.offset(block) + HASH_TABLE_OFFSET)
+            blocks.extend(reversed(table[HASH_TABLE_SIZE - min(count, HASH_TABLE_SIZE):]))
+            block = self.long(block, BLOCK_SIZE - 8)
+        return blocks
+
+    def read(self, entry, size=None):
+        """The contents of a file as bytes, or only the first size bytes of it"""
+        remaining = entry.size if size is None else min(size, entry.size)
+        parts = []
+        for block in self.data_blocks(entry):
+            if remaining <= 0:
+                break
+            start = self.offset(block)
+            if self.ffs:
+                length = min(BLOCK_SIZE, remaining)
+            else:
+                length = min(ofsDataStruct.unpack_from(self.buf, start)[3], BLOCK_SIZE - OFS_DATA_OFFSET, remaining)
+                start += OFS_DATA_OFFSET
+            parts.append(self.buf[start:start + length])
+            remaining -= length
+        if remaining > 0:
+            raise BadAdfImage("%s is missing %d bytes of its data" % (entry.path, remaining))
+        return b''.join(parts)
+
+    def open(self, entry):
+        """A file of the image as a binary file object"""
+        return io.BytesIO(self.read(entry))
+
+    def amos_files(self):
+        """The entries that are Amos source files, from their headers rather than their names"""
+        for entry in self.entries():
+            try:
+                head = self.read(entry, 16)
+            except BadAdfImage:
+                continue
+            if version_kind(head) in AMOS_KINDS:
+                yield entry
+
+
+def convert_image(filename, converter_factory=Converter):
+    """Convert every Amos file in an image in one pass.
+    Yields (entry, converter, lines) for each, where lines is a generator
+    that starts with the header, as Converter.do_buffer's does."""
+    with AdfImage(filename) as image:
+        for entry in image.amos_files():
+            converter = converter_factory()
+            yield entry, converter, converter.do_buffer(image.read(entry), entry.path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List, or convert, the Amos files in adf disk images")
+    parser.add_argument('images', nargs='+')
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help="Write the text of each Amos file here, under a directory named after its image")
+    args = parser.parse_args(argv)
+    failed = 0
+    for image in args.images:
+        conversions = ((entry.path, converter, lines) for entry, converter, lines in convert_image(image))
+        failed += write_conversions(image, conversions, args.output_dir)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
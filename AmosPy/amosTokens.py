@@ -1,88 +1,7 @@
-"""Token table and code to deal with special cases."""
-import struct
-
-
-def readRem(byteStream):
-    """The rem - remark/comment type tokens"""
-    commentLength = struct.unpack('bb', byteStream.read(2))[1]
-    bytesRead = 2
-    comment = struct.unpack('%ds' % commentLength, byteStream.read(commentLength))[0].rstrip("\x00")
-    bytesRead += commentLength
-    return bytesRead, comment
-
-
-def readVal(byteStream):
-    """Values - all seem to be 4 bytes long"""
-    intVal = struct.unpack('>i', byteStream.read(4))[0]
-    return 4, intVal
-
-
-def readFloatVal(byteStream):
-    """Read a floating point value"""
-    floatVal = struct.unpack(">f", byteStream.read(4))[0]
-    return 4, floatVal
-
-
-def readLabelType(byteStream):
-    """Labels - for goto, variables, procedure calls etc"""
-    bytesRead = 0
-    unknown, length, flags = struct.unpack("Hbb", byteStream.read(4))
-    bytesRead += 4
-    name = str(struct.unpack("%ds" % length, byteStream.read(length))[0].rstrip(b"\x00"))
-    if flags & 1:
-        name += "#"  # Floats in amos
-    elif flags and 2:
-        name += "$"
-    bytesRead += length
-    return bytesRead, name
-
-
-def unknownSize(size):
-    """Some tokens have an 'unknown' extra bytes. Make sure to eat them"""
-    def _read(byteStream):
-        byteStream.read(size)
-        return size, None
-    return _read
-
-
-def readString(byteStream):
-    """String constants"""
-    bytesRead = 0
-    length = struct.unpack(">h", byteStream.read(2))[0]
-    bytesRead += 2
-    #Round to next word boundary
-    if length % 2:
-        length += 1
-    unpacked = struct.unpack("%ds" % length, byteStream.read(length))
-    data = unpacked[0].rstrip(b"\x00")
-    bytesRead += length
-    return bytesRead, data
-
-
-def readProcedure(byteStream):
-    """This is the procedure declaration. So far - nothing can be done for a compiled or encrypted one"""
-    bytesRead = 0
-    bytesToEnd, encSeed, flagsB, encSeed2 = struct.unpack(">ihbb", byteStream.read(8))
-    bytesRead += 8
-    flags = set()
-    if flagsB & 2 ** 7:
-        flags.add('folded')
-    if flagsB & 2 ** 6:
-        flags.add('locked')
-    if flagsB & 2 ** 5:
-        flags.add('encrypted')
-    if flagsB & 2 ** 4:
-        flags.add('compiled')
-    if 'compiled' in flags:
-        byteStream.read(bytesToEnd)
-        bytesRead += bytesToEnd
-    return bytesRead, {'bytesToEnd': bytesToEnd, 'encSeed': (encSeed, encSeed2), 'flags': flags}
-
-
-def readExtension(byteStream):
-    """An extension token. For now - look in extensions.py for their mappings"""
-    extNo, unused, extToken = struct.unpack('>2bH', byteStream.read(4))
-    return 6, (extNo, extToken)
+"""Token table and code to deal with special cases.
+The payload readers live in payloads.py."""
+from AmosPy.payloads import (readRem, readVal, readFloatVal, readLabelType, unknownSize,
+                             readString, readProcedure, readExtension)
 
 #Given majority have no extra, a simple string, or length 1 tuple is the default
 token_map = {
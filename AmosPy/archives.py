@@ -0,0 +1,167 @@
+"""Convert the Amos files inside zip, tar and lha archives without extracting them.
+Members are decompressed as they are read and decoded straight from the
+stream, one at a time, so nothing is written to disk and no more than one
+member's worth of data is ever in memory - tar archives (plain or gz, bz2
+or xz compressed) are read strictly front to back.
+Reading lha archives needs the lhafile package; the other kinds only need
+the standard library."""
+from __future__ import print_function
+import argparse
+import io
+import os
+import struct
+import sys
+import tarfile
+import zipfile
+import zlib
+from AmosPy.batch import is_amos_file
+from AmosPy.converter import Converter
+from AmosPy.output import compression_for, open_output, write_lines
+from AmosPy.token_reader import BadTokenRead
+
+try:
+    from lzma import LZMAError
+except ImportError:
+    LZMAError = IOError  # No xz support, so no xz errors either
+
+__author__ = 'danny'
+
+LHA_EXTENSIONS = ('.lha', '.lzh')
+
+
+class BadArchive(Exception):
+    pass
+
+
+# What one member can fail with: decoding it, decompressing it, or writing its text
+MEMBER_ERRORS = (BadTokenRead, BadArchive, struct.error, IOError, OSError, EOFError, UnicodeError,
+                 zlib.error, LZMAError, zipfile.BadZipfile, tarfile.TarError)
+
+
+def archive_kind(path):
+    if path.lower().endswith(LHA_EXTENSIONS):
+        return 'lha'
+    if zipfile.is_zipfile(path):
+        return 'zip'
+    return 'tar'
+
+
+def zip_members(path, match):
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if not info.filename.endswith('/') and match(info.filename):
+                with archive.open(info) as stream:
+                    yield info.filename, stream
+
+
+def tar_members(path, match):
+    try:
+        archive = tarfile.open(path, 'r|*')
+    except tarfile.TarError as error:
+        raise BadArchive("%s: %s" % (path, error))
+    with archive:
+        for info in archive:
+            if info.isfile() and match(info.name):
+                stream = archive.extractfile(info)
+                try:
+                    yield info.name, stream
+                finally:
+                    stream.close()
+
+
+def lha_members(path, match):
+    try:
+        import lhafile
+    except ImportError:
+        raise BadArchive("Reading %s needs the lhafile package" % path)
+    archive = lhafile.LhaFile(path)
+    try:
+        for info in archive.infolist():
+            name = info.filename.replace('\\', '/')
+            if match(name):
+                # lhafile can only decompress a whole member at once
+                yield name, io.BytesIO(archive.read(info.filename))
+    finally:
+        archive.fp.close()
+
+
+member_readers = {'zip': zip_members, 'tar': tar_members, 'lha': lha_members}
+
+
+def archive_members(path, match=is_amos_file):
+    """Yield (name, stream) for the members of an archive whose names pass match.
+    Each stream is only readable until the next member is asked for."""
+    return member_readers[archive_kind(path)](path, match)
+
+
+def convert_archive(path, converter_factory=Converter, match=is_amos_file):
+    """Convert the Amos files in an archive as they stream past.
+    Yields (name, converter, lines) for each, where lines is a generator that starts
+    with the header, as Converter.do_stream's does, and must be used up before the next."""
+    for name, stream in archive_members(path, match):
+        converter = converter_factory()
+        yield name, converter, converter.do_stream(stream, name)
+
+
+def member_destination(output_dir, container, name):
+    """Where the text of a member goes: output_dir/container's name/member's path.txt.
+    Absolute, drive and .. parts of the member's path are dropped, and anything that
+    would still land outside output_dir (through a symlink, say) raises BadArchive."""
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    if parts and parts[0].endswith(':'):
+        parts = parts[1:]
+    if not parts:
+        raise BadArchive("Member name %r has no usable path" % name)
+    destination = os.path.join(output_dir, os.path.basename(container), *parts) + '.txt'
+    if not os.path.realpath(destination).startswith(os.path.join(os.path.realpath(output_dir), '')):
+        raise BadArchive("Member %r would be written outside %s" % (name, output_dir))
+    return destination
+
+
+def write_conversions(container, conversions, output_dir=None):
+    """Write, or just list, the (name, converter, lines) conversions of the files in a container
+    (an archive or disk image) into output_dir/container's name/. Returns how many failed"""
+    failed = 0
+    for name, converter, lines in conversions:
+        partial = None
+        try:
+            header = next(lines)
+            if output_dir is None:
+                print("%s:%s: %d code bytes" % (container, name, header['length']))
+                continue
+            destination = member_destination(output_dir, container, name)
+            if not os.path.isdir(os.path.dirname(destination)):
+                os.makedirs(os.path.dirname(destination))
+            partial = destination + '.partial'
+            with open_output(partial, compression_for(destination)) as sink:
+                write_lines(lines, sink)
+            os.rename(partial, destination)
+        except MEMBER_ERRORS as error:
+            failed += 1
+            if partial is not None and os.path.exists(partial):
+                os.remove(partial)
+            print("%s:%s: FAILED %s" % (container, name, (str(error) or type(error).__name__).splitlines()[0]))
+            continue
+        print("%s:%s: %d of %d code bytes read, %d unknown tokens -> %s" % (
+            container, name, converter.bytes_read, header['length'], converter.unknown_tokens, destination))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List, or convert, the Amos files in zip, tar and lha archives")
+    parser.add_argument('archives', nargs='+')
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help="Write the text of each Amos file here, under a directory named after its archive")
+    args = parser.parse_args(argv)
+    failed = 0
+    for path in args.archives:
+        try:
+            failed += write_conversions(path, convert_archive(path), args.output_dir)
+        except BadArchive as error:
+            failed += 1
+            print("%s: FAILED %s" % (path, error))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Memory banks stored after the code section of an Amos file.
+After the code comes "AmBs" and a bank count, then each bank. Sprite and
+icon banks start "AmSp" or "AmIc", every other kind (samples, music, data...)
+starts "AmBk" with a bank number, memory type, length and 8 character name.
+Each bank record is also the format of a standalone .abk file, so banks
+are extracted whole, straight from a memory mapped file."""
+from __future__ import print_function
+import os
+import struct
+import sys
+from collections import namedtuple
+from AmosPy.converter import HEADER_SIZE, mapped_file, readHeaderFrom
+
+__author__ = 'danny'
+
+banksStruct = struct.Struct('>4sH')
+bankStruct = struct.Struct('>4sHHI8s')
+spriteBankStruct = struct.Struct('>4sH')
+spriteStruct = struct.Struct('>5H')
+PALETTE_SIZE = 32 * 2
+BANK_LENGTH_MASK = 0x0fffffff
+
+# offset/length cover the whole bank record, data_offset/data_length just its contents
+BankInfo = namedtuple('BankInfo', 'number name chip offset length data_offset data_length')
+
+
+class BadBankRead(Exception):
+    pass
+
+
+def readSpriteBank(buf, offset, number, name):
+    magic, count = spriteBankStruct.unpack_from(buf, offset)
+    end = offset + spriteBankStruct.size
+    for _ in range(count):
+        width, height, depth, hotX, hotY = spriteStruct.unpack_from(buf, end)
+        end += spriteStruct.size + width * 2 * height * depth
+    end += PALETTE_SIZE
+    return BankInfo(number, name, True, offset, end - offset, offset + spriteBankStruct.size,
+                    end - offset - spriteBankStruct.size)
+
+
+def readBank(buf, offset):
+    magic = buf[offset:offset + 4]
+    if magic == b'AmSp':
+        return readSpriteBank(buf, offset, 1, 'Sprites')
+    if magic == b'AmIc':
+        return readSpriteBank(buf, offset, 2, 'Icons')
+    if magic != b'AmBk':
+        raise BadBankRead("Unknown bank type %r at offset %d" % (magic, offset))
+    magic, number, fastMem, length, name = bankStruct.unpack_from(buf, offset)
+    length &= BANK_LENGTH_MASK
+    name = name.decode('latin-1').rstrip(' \x00')
+    return BankInfo(number, name, fastMem == 0, offset, 12 + length, offset + bankStruct.size, length - 8)
+
+
+def list_banks(buf):
+    """List the banks in a whole Amos file held in a bytes-like object"""
+    offset = HEADER_SIZE + readHeaderFrom(buf)['length']
+    if buf[offset:offset + 4] != b'AmBs':
+        return []
+    magic, count = banksStruct.unpack_from(buf, offset)
+    offset += banksStruct.size
+    banks = []
+    for _ in range(count):
+        bank = readBank(buf, offset)
+        if bank.offset + bank.length > len(buf):
+            raise BadBankRead("Bank %d (%s) runs past the end of the file" % (bank.number, bank.name))
+        banks.append(bank)
+        offset += bank.length
+    return banks
+
+
+def write_span(buf, start, end, out):
+    """Write part of a buffer to a file without copying it"""
+    view = memoryview(buf)
+    chunk = view[start:end]
+    try:
+        out.write(chunk)
+    finally:
+        if hasattr(chunk, 'release'):
+            chunk.release()
+            view.release()
+
+
+def bank_filename(bank):
+    name = ''.join(char if char.isalnum() else '_' for char in bank.name) or 'Bank'
+    return "%02d_%s.abk" % (bank.number, name)
+
+
+def extract_banks(filename, directory, data_only=False):
+    """Write every bank in an Amos file into directory, as .abk files,
+    or just their contents with data_only. Returns the banks and the paths written."""
+    written = []
+    with mapped_file(filename) as buf:
+        banks = list_banks(buf)
+        if banks and not os.path.isdir(directory):
+            os.makedirs(directory)
+        for bank in banks:
+            path = os.path.join(directory, bank_filename(bank))
+            start, length = (bank.data_offset, bank.data_length) if data_only else (bank.offset, bank.length)
+            with open(path, 'wb') as out:
+                write_span(buf, start, start + length, out)
+            written.append((bank, path))
+    return written
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("Usage: banks.py amos_file [output_directory]")
+        return 1
+    if len(argv) > 1:
+        for bank, path in extract_banks(argv[0], argv[1]):
+            print("Bank %d (%s): %d bytes -> %s" % (bank.number, bank.name, bank.data_length, path))
+        return 0
+    with mapped_file(argv[0]) as buf:
+        for bank in list_banks(buf):
+            print("Bank %d (%s): %d bytes%s" % (bank.number, bank.name, bank.data_length,
+                                                ", chip memory" if bank.chip else ""))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
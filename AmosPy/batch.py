@@ -0,0 +1,256 @@
+"""Convert whole directories of Amos files, spread over a process pool.
+Results come back in the order the files were found, so progress can be
+followed (and a stopped run picked up again) file by file. Files whose
+output is already newer than the source are skipped."""
+from __future__ import print_function
+import argparse
+import glob
+import os
+import sys
+from multiprocessing import Pool
+from AmosPy.cache import ConversionCache
+from AmosPy.converter import Converter
+from AmosPy.output import compression_for, open_output, write_lines
+from AmosPy.probe import format_header, format_info, probe_all, PROBE_THREADS
+from AmosPy.profiling import Profiler
+from AmosPy.verify import Verification, verify_file
+
+__author__ = 'danny'
+
+AMOS_EXTENSION = '.amos'
+OUTPUT_EXTENSION = '.txt'
+
+
+def is_amos_file(filename):
+    return filename.lower().endswith(AMOS_EXTENSION)
+
+
+def find_amos_files(paths, match=is_amos_file):
+    """Expand glob patterns and directories (recursively) into a sorted list
+    of (source, root) pairs, where root is the directory the source was found under.
+    Only files in directories whose names pass match are included. A pattern matching
+    nothing is kept as it is, so it is reported as a file that can't be read."""
+    found = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if not os.path.isdir(path):
+                found.append((path, os.path.dirname(path)))
+                continue
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                found.extend((os.path.join(dirpath, filename), path)
+                             for filename in sorted(filenames) if match(filename))
+    return found
+
+
+def output_path(source, root, output_dir=None, extension=OUTPUT_EXTENSION):
+    """Outputs go next to the source, or into the same relative place under output_dir"""
+    if output_dir is None:
+        return source + extension
+    return os.path.join(output_dir, os.path.relpath(source, root or os.curdir) + extension)
+
+
+def is_up_to_date(source, destination):
+    try:
+        return os.path.getmtime(destination) >= os.path.getmtime(source)
+    except OSError:
+        return False
+
+
+_caches = {}
+
+
+def conversion_cache(directory, tolerant, decrypt):
+    """The ConversionCache for a directory, made once per process so its running size is kept between files"""
+    key = (directory, tolerant, decrypt)
+    if key not in _caches:
+        _caches[key] = ConversionCache(directory, tolerant=tolerant, decrypt=decrypt)
+    return _caches[key]
+
+
+def convert_one(job):
+    """Convert a single file, returning a dict summarising how it went.
+    Output is written to a temporary name and renamed, so an interrupted
+    run never leaves a partial file that looks finished."""
+    source, destination, options = job
+    result = {'source': source, 'destination': destination, 'length': None,
+              'bytes_read': 0, 'unknown_tokens': 0, 'error': None, 'bad_lines': []}
+    profiler = Profiler() if options.get('profile') else None
+    converter = Converter(profiler, options.get('tolerant', False), options.get('decrypt', False))
+    partial = destination + '.partial'
+    try:
+        if options.get('cache_dir'):
+            items, stats = conversion_cache(options['cache_dir'], converter.tolerant,
+                                            converter.decrypt).convert(source)
+            header = stats['header']
+            converter.bytes_read = stats['bytes_read']
+            converter.unknown_tokens = stats['unknown_tokens']
+            converter.errors = stats.get('errors', [])
+        else:
+            items = converter.do_file(source, mapped=True)
+            header = next(items)
+        result['length'] = header['length']
+        destination_dir = os.path.dirname(destination)
+        if destination_dir and not os.path.isdir(destination_dir):
+            os.makedirs(destination_dir)
+        with open_output(partial, compression_for(destination)) as fd:
+            write_lines(items, fd)
+        os.rename(partial, destination)
+    except Exception as error:
+        # A missing, unreadable or undecodable file fails on its own, rather than stopping the batch
+        result['error'] = '%s: %s' % (type(error).__name__, error)
+        if os.path.exists(partial):
+            os.remove(partial)
+    result['bytes_read'] = converter.bytes_read
+    result['unknown_tokens'] = converter.unknown_tokens
+    result['bad_lines'] = converter.errors
+    if profiler is not None:
+        result['profile'] = profiler.as_dict()
+    return result
+
+
+def convert_pooled(conversions, jobs):
+    if jobs == 1:
+        for job in conversions:
+            yield convert_one(job)
+        return
+    pool = Pool(jobs)
+    try:
+        for result in pool.imap(convert_one, conversions, 4):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def convert_batch(paths, jobs=None, output_dir=None, force=False, **options):
+    """Convert every Amos file under paths, yielding a result dict per file in order.
+    Files that are up to date are yielded with 'skipped' set and not converted.
+    jobs is the number of worker processes (default: one per cpu, 1 converts in this process).
+    Options are:
+    cache_dir - look conversions up in (and add them to) a ConversionCache there
+    profile - give each result a 'profile' from a profiling.Profiler (except cache hits)
+    tolerant - skip lines that fail to decode, listing them in the result's 'bad_lines'
+    decrypt - decrypt encrypted procedures
+    compress - 'gz' or 'xz' to compress the outputs"""
+    extension = OUTPUT_EXTENSION
+    if options.get('compress'):
+        extension += '.' + options['compress']
+    jobList = []
+    for source, root in find_amos_files(paths):
+        destination = output_path(source, root, output_dir, extension)
+        jobList.append((source, destination, not force and is_up_to_date(source, destination)))
+    results = convert_pooled([(source, destination, options)
+                              for source, destination, skip in jobList if not skip], jobs)
+    for source, destination, skip in jobList:
+        if skip:
+            yield {'source': source, 'destination': destination, 'skipped': True}
+        else:
+            yield next(results)
+
+
+def format_result(result):
+    if result.get('skipped'):
+        return "%s: up to date" % result['source']
+    if result['length'] is None and result['error']:
+        return "%s: FAILED %s" % (result['source'], result['error'].splitlines()[0])
+    summary = "%s: %d of %s code bytes read, %d unknown tokens" % (
+        result['source'], result['bytes_read'], result['length'], result['unknown_tokens'])
+    if result['bad_lines']:
+        summary += ", %d bad lines from offset 0x%x" % (len(result['bad_lines']), result['bad_lines'][0]['offset'])
+    if result['error']:
+        summary += ", FAILED %s" % result['error'].splitlines()[0]
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert many Amos files to text in parallel")
+    parser.add_argument('paths', nargs='+', help="Amos files, directories or glob patterns")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Worker processes (default: cpu count)")
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help="Write outputs into this tree instead of next to the sources")
+    parser.add_argument('-f', '--force', action='store_true', help="Convert files even if their output is up to date")
+    parser.add_argument('--cache', default=None, help="Directory of a conversion cache to use")
+    parser.add_argument('--profile', default=None, help="Write token statistics and timings as json to this file")
+    parser.add_argument('-t', '--tolerant', action='store_true',
+                        help="Carry on past lines that fail to decode, leaving a placeholder")
+    parser.add_argument('-d', '--decrypt', action='store_true', help="Decrypt encrypted procedures")
+    parser.add_argument('-z', '--compress', choices=['gz', 'xz'], default=None, help="Compress the outputs")
+    parser.add_argument('--probe', action='store_true',
+                        help="Only read the headers, and list each file's version, code length and banks")
+    parser.add_argument('--all-files', action='store_true', help="With --probe, look at every file in directories")
+    parser.add_argument('--verify', action='store_true',
+                        help="Only check that each file's code is structurally intact, without converting it")
+    args = parser.parse_args(argv)
+    if args.verify:
+        return verify_main(args.paths, args.jobs)
+    if args.probe:
+        return probe_main(args.paths, args.jobs or PROBE_THREADS, args.all_files)
+
+    totals = {'files': 0, 'skipped': 0, 'failed': 0, 'bytes_read': 0, 'unknown_tokens': 0}
+    profiler = Profiler()
+    for result in convert_batch(args.paths, args.jobs, args.output_dir, args.force, cache_dir=args.cache,
+                                profile=args.profile is not None, tolerant=args.tolerant,
+                                decrypt=args.decrypt, compress=args.compress):
+        totals['files'] += 1
+        if 'profile' in result:
+            profiler.merge(result['profile'])
+        print(format_result(result))
+        sys.stdout.flush()
+        if result.get('skipped'):
+            totals['skipped'] += 1
+            continue
+        totals['bytes_read'] += result['bytes_read']
+        totals['unknown_tokens'] += result['unknown_tokens']
+        if result['error']:
+            totals['failed'] += 1
+    print("%(files)d files, %(skipped)d up to date, %(failed)d failed, "
+          "%(bytes_read)d code bytes read, %(unknown_tokens)d unknown tokens" % totals)
+    if args.profile:
+        with open(args.profile, 'w') as fd:
+            profiler.write_json(fd)
+    return 1 if totals['failed'] else 0
+
+
+def probe_main(paths, threads, all_files=False):
+    match = (lambda filename: True) if all_files else is_amos_file
+    kinds = {}
+    print(format_header())
+    for info in probe_all([source for source, root in find_amos_files(paths, match)], threads):
+        kinds[info.kind or 'error'] = kinds.get(info.kind or 'error', 0) + 1
+        print(format_info(info))
+    print(", ".join("%d %s" % (count, kind) for kind, count in sorted(kinds.items())) or "No files found")
+    return 0
+
+
+def verify_one(source):
+    try:
+        return verify_file(source)
+    except Exception as error:
+        return Verification(0, 0, 0, '%s: %s' % (type(error).__name__, error))
+
+
+def verify_main(paths, jobs=None):
+    sources = [source for source, root in find_amos_files(paths)]
+    failed = 0
+    pool = Pool(jobs)
+    try:
+        for source, result in zip(sources, pool.imap(verify_one, sources, 4)):
+            if result.error is None:
+                print("%s: OK, %d lines, %d tokens" % (source, result.lines, result.tokens))
+            else:
+                failed += 1
+                print("%s: FAILED at offset 0x%x: %s" % (source, result.offset, result.error))
+            sys.stdout.flush()
+    finally:
+        pool.terminate()
+        pool.join()
+    print("%d files, %d failed" % (len(sources), failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
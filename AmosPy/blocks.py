@@ -0,0 +1,198 @@
+"""An index of the block structure of an Amos program.
+For, Repeat, While, Do and block If are matched with their Next, Until,
+Wend, Loop and EndIf (and procedures with End Proc) in one walk over the
+tokens, which steps over payloads by size and decodes nothing but the
+extra words these tokens carry. Those words are filled in by the editor
+when a program is tested, as jump offsets, so they are kept with each
+block and jump as they were found rather than trusted to find its partner.
+
+Once built, the partner of any block token is a dict lookup, each line's
+innermost block is an array lookup, and the blocks in order with their
+depth are the program's outline."""
+from __future__ import print_function
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from AmosPy.converter import HEADER_SIZE, mapped_file, readHeaderFrom
+from AmosPy.decode_table import buffer_table, UNKNOWN
+from AmosPy.procedures import PROCEDURE_TOKEN, END_PROC_TOKEN
+from AmosPy.token_reader import lineHeaderStruct, walkTokens
+
+__author__ = 'danny'
+
+IF_TOKEN, THEN_TOKEN, ELSE_TOKEN = 0x02be, 0x02c6, 0x02d0
+# Opening token: (block kind, closing token)
+BLOCK_OPENERS = {
+    0x023c: ('For', 0x0246),
+    0x0250: ('Repeat', 0x025c),
+    0x0268: ('While', 0x0274),
+    0x027e: ('Do', 0x0286),
+    IF_TOKEN: ('If', 0x02da),
+    PROCEDURE_TOKEN: ('Procedure', END_PROC_TOKEN),
+}
+BLOCK_CLOSERS = dict((closer, kind) for kind, closer in BLOCK_OPENERS.values())
+CLOSING_TOKENS = dict(BLOCK_OPENERS.values())
+JUMP_TOKENS = {0x0290: 'Exit If', 0x029e: 'Exit', 0x0316: 'On'}
+LOOP_KINDS = ('For', 'Repeat', 'While', 'Do')
+# Tokens whose payload is nothing but jump words
+WORD_TOKENS = (0x023c, 0x0250, 0x0268, 0x027e, IF_TOKEN, ELSE_TOKEN) + tuple(JUMP_TOKENS)
+
+# start - offset of the opening token. end - offset just past the closing token, None if never closed.
+# open_line/close_line - their line numbers. elses - offsets of the Else tokens of an If.
+# parent - index of the enclosing block, -1 at the top. words - the opening token's jump words.
+Block = namedtuple('Block', 'kind depth start end open_line close_line elses parent words')
+# block - index of the loop an Exit leaves, or -1
+Jump = namedtuple('Jump', 'kind offset line words block')
+
+
+def jumpWords(buf, offset, size):
+    """The jump words in the size byte payload at offset"""
+    return struct.unpack_from('>%dH' % (size // 2), buf, offset)
+
+
+def lineTokens(buf, offset, lineEnd, table):
+    """(token, offset, payload size) for the tokens of a line, up to an unknown token or the
+    line's end, or a payload whose size can't be read"""
+    tokens = []
+    try:
+        for token, position, entry, size in walkTokens(buf, offset, lineEnd, table):
+            if token == 0 or entry is UNKNOWN:
+                break
+            tokens.append((token, position, size))
+    except struct.error:
+        pass
+    return tokens
+
+
+class BlockIndex(object):
+    """The blocks and jumps of a program, and whatever didn't match up in problems,
+    as (offset, message) pairs"""
+    def __init__(self):
+        self.blocks = []
+        self.jumps = []
+        self.problems = []
+        self.partners = {}  # Offset of a block token to the offset of the token it jumps to
+        self.token_blocks = {}  # Offset of a block token to the index of its block
+        self.line_offsets = array('I')
+        self.indents = array('B')
+        self.line_blocks = array('i')  # Innermost block open at the start of each line, or -1
+
+    @classmethod
+    def from_buffer(cls, buf):
+        """Index a whole Amos file held in a bytes-like object"""
+        index = cls()
+        table = buffer_table()
+        codeEnd = min(HEADER_SIZE + readHeaderFrom(buf)['length'], len(buf))
+        stack = []
+        offset = HEADER_SIZE
+        lineNo = 0
+        while offset + 2 <= codeEnd:
+            lineLength, indentLevel = lineHeaderStruct.unpack_from(buf, offset)
+            lineEnd = offset + max(lineLength * 2, 2)
+            index.line_offsets.append(offset)
+            index.indents.append(indentLevel)
+            index.line_blocks.append(stack[-1] if stack else -1)
+            tokens = lineTokens(buf, offset + 2, lineEnd, table)
+            singleLineIf = THEN_TOKEN in [token for token, tokenOffset, size in tokens]
+            for token, tokenOffset, size in tokens:
+                words = jumpWords(buf, tokenOffset + 2, size) if token in WORD_TOKENS else ()
+                if token in BLOCK_OPENERS and not (token == IF_TOKEN and singleLineIf):
+                    stack.append(len(index.blocks))
+                    index.token_blocks[tokenOffset] = len(index.blocks)
+                    index.blocks.append(Block(BLOCK_OPENERS[token][0], len(stack) - 1, tokenOffset, None,
+                                              lineNo, None, [], stack[-2] if len(stack) > 1 else -1, words))
+                elif token in BLOCK_CLOSERS:
+                    index.close(stack, BLOCK_CLOSERS[token], tokenOffset, tokenOffset + 2 + size, lineNo)
+                elif token == ELSE_TOKEN and not singleLineIf:
+                    if stack and index.blocks[stack[-1]].kind == 'If':
+                        index.blocks[stack[-1]].elses.append(tokenOffset)
+                        index.token_blocks[tokenOffset] = stack[-1]
+                    else:
+                        index.problems.append((tokenOffset, "Else outside an If"))
+                elif token in JUMP_TOKENS:
+                    loops = [block for block in stack if index.blocks[block].kind in LOOP_KINDS]
+                    target = loops[-1] if loops and JUMP_TOKENS[token] != 'On' else -1
+                    index.jumps.append(Jump(JUMP_TOKENS[token], tokenOffset, lineNo, words, target))
+            offset = lineEnd
+            lineNo += 1
+        for block in stack:
+            index.problems.append((index.blocks[block].start, "%s is never closed" % index.blocks[block].kind))
+        for block in index.blocks:
+            if block.end is not None:
+                closer = block.end - 2
+                index.partners[block.start] = closer
+                index.partners[closer] = block.start
+                for elseOffset in block.elses:
+                    index.partners[elseOffset] = closer
+        return index
+
+    def close(self, stack, kind, offset, end, lineNo):
+        """Close the innermost open block of a kind. Blocks opened inside
+        it and left open, and closers with no block to close, are problems"""
+        openKinds = [self.blocks[block].kind for block in stack]
+        if kind not in openKinds:
+            self.problems.append((offset, "%s without %s" % (buffer_table()[CLOSING_TOKENS[kind]].name, kind)))
+            return
+        while self.blocks[stack[-1]].kind != kind:
+            block = self.blocks[stack.pop()]
+            self.problems.append((block.start, "%s is never closed" % block.kind))
+        blockNo = stack.pop()
+        self.blocks[blockNo] = self.blocks[blockNo]._replace(end=end, close_line=lineNo)
+        self.token_blocks[offset] = blockNo
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def match(self, offset):
+        """The offset of the token matching the block token at offset: the closer of an
+        opener or Else, or the opener of a closer. None if it has no match"""
+        return self.partners.get(offset)
+
+    def block_of(self, offset):
+        """The block a For, Next, Else, etc at offset belongs to"""
+        return self.blocks[self.token_blocks[offset]]
+
+    def enclosing(self, lineNo):
+        """The blocks open at the start of a line, innermost first"""
+        blockNo = self.line_blocks[lineNo]
+        while blockNo >= 0:
+            yield self.blocks[blockNo]
+            blockNo = self.blocks[blockNo].parent
+
+    def outline(self):
+        """(depth, kind, open_line, close_line) for every block, in order"""
+        return [(block.depth, block.kind, block.open_line, block.close_line) for block in self.blocks]
+
+    def indent_problems(self):
+        """Line numbers of the lines inside a block that aren't indented deeper than the line
+        opening it, other than the lines of an If's Elses"""
+        lines = []
+        for block in self.blocks:
+            if block.close_line is None or block.kind == 'Procedure':
+                continue
+            elseLines = set(bisect_right(self.line_offsets, offset) - 1 for offset in block.elses)
+            for lineNo in range(block.open_line + 1, block.close_line):
+                if lineNo not in elseLines and self.indents[lineNo] <= self.indents[block.open_line]:
+                    lines.append(lineNo)
+        return sorted(set(lines))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("Usage: blocks.py amos_file")
+        return 1
+    with mapped_file(argv[0]) as buf:
+        index = BlockIndex.from_buffer(buf)
+    for depth, kind, openLine, closeLine in index.outline():
+        end = '?' if closeLine is None else str(closeLine + 1)
+        print("%s%s: lines %d-%s" % ('  ' * depth, kind, openLine + 1, end))
+    for offset, problem in index.problems:
+        print("0x%x: %s" % (offset, problem))
+    return 1 if index.problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
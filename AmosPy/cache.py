@@ -0,0 +1,134 @@
+"""An on disk cache of conversions, keyed on the hash of the file contents.
+The key also includes a fingerprint of the token and extension tables,
+so entries made with older tables are never returned after they change.
+Entries are small json files; the least recently used ones are removed
+once the cache grows past its size limit. The cache's size is kept as a
+running total, so the directory is only scanned when it may need trimming."""
+import hashlib
+import json
+import os
+import tempfile
+from AmosPy.payloads import handlerName
+from AmosPy.converter import Converter, mapped_file
+from AmosPy.decode_table import token_entries
+from AmosPy.extensions import extensions_table
+
+__author__ = 'danny'
+
+CACHE_FORMAT = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+RESCAN_PUTS = 256
+
+
+def table_fingerprint(entries=None, extensions=extensions_table):
+    """A short hash that changes whenever the token or extension tables do.
+    entries are (token, name, handler), by default those of the token table, which
+    comes from the precompiled table when it is current rather than amosTokens."""
+    digest = hashlib.sha1(('format %d\n' % CACHE_FORMAT).encode('ascii'))
+    for token, name, handler in sorted(token_entries() if entries is None else entries):
+        digest.update(('%04x %r %s\n' % (token, name, handlerName(handler) if handler else '')).encode('utf-8'))
+    for extNo in sorted(extensions):
+        for token in sorted(extensions[extNo]):
+            digest.update(('%d %04x %r\n' % (extNo, token, extensions[extNo][token])).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class ConversionCache(object):
+    """With tolerant or decrypt set, conversions are made (and kept apart) with a Converter set the same way"""
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, fingerprint=None, tolerant=False, decrypt=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fingerprint = (fingerprint or table_fingerprint()) + ('t' if tolerant else '') + ('d' if decrypt else '')
+        self.tolerant = tolerant
+        self.decrypt = decrypt
+        self.total = None  # Running estimate of the cache's size, None until it is first scanned
+        self.puts = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, buf):
+        return hashlib.sha1(buf).hexdigest() + '-' + self.fingerprint
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key):
+        """Return the cached (lines, stats) for a key, or None. A hit marks the entry as recently used."""
+        path = self.path(key)
+        try:
+            with open(path) as fd:
+                entry = json.load(fd)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        stats = entry['stats']
+        stats['header']['version'] = stats['header']['version'].encode('latin-1')
+        return entry['lines'], stats
+
+    def put(self, key, lines, stats):
+        header = dict(stats['header'], version=stats['header']['version'].decode('latin-1'))
+        entry = {'lines': lines, 'stats': dict(stats, header=header)}
+        path = self.path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        fd, partial = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.partial')
+        with os.fdopen(fd, 'w') as out:
+            json.dump(entry, out)
+            size = out.tell()
+        os.rename(partial, path)
+        self.added(size)
+
+    def added(self, size):
+        """Keep a running total of the cache's size rather than scanning it on every put.
+        The directory is only scanned (and trimmed) when the total passes max_bytes, and
+        every RESCAN_PUTS puts to take in what other processes sharing it have written."""
+        self.puts += 1
+        if self.total is None or self.puts % RESCAN_PUTS == 0:
+            self.evict()
+        else:
+            self.total += size
+            if self.total > self.max_bytes:
+                self.evict()
+
+    def entries(self):
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith('.json'):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        info = os.stat(path)
+                    except OSError:
+                        continue  # Removed by another process
+                    yield info.st_mtime, info.st_size, path
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = sorted(self.entries())
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.total = total
+
+    def convert(self, filename):
+        """Convert a file, or fetch its conversion from the cache.
+        Returns the lines of text, and a stats dict with the header, bytes_read, unknown_tokens
+        and the errors of a tolerant conversion."""
+        with mapped_file(filename) as buf:
+            key = self.key(buf)
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+            converter = Converter(tolerant=self.tolerant, decrypt=self.decrypt)
+            items = converter.do_buffer(buf)
+            header = next(items)
+            lines = list(items)
+        stats = {'header': header, 'bytes_read': converter.bytes_read, 'unknown_tokens': converter.unknown_tokens,
+                 'errors': converter.errors}
+        self.put(key, lines, stats)
+        return lines, stats
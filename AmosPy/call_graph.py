@@ -0,0 +1,207 @@
+"""The procedure call graph of an Amos program.
+Each procedure's body, and the main program (everything outside the
+procedures), is walked for its Call tokens, stepping over other payloads
+by size, giving the names it calls. From that graph come the procedures
+reachable from the main program, the dead ones, and everything a chosen
+procedure needs, directly or not - what has to go with it into a library.
+
+The calls found in each span are kept against a hash of the span's bytes,
+so when a file is looked at again only the procedures whose bytes have
+changed are walked again; CallGraphCache keeps those per file on disk.
+Procedure names are matched ignoring case, as Amos does."""
+from __future__ import print_function
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+from AmosPy.cache import table_fingerprint
+from AmosPy.converter import HEADER_SIZE, mapped_file, readHeaderFrom
+from AmosPy.decode_table import buffer_table, UNKNOWN
+from AmosPy.decrypt import decrypt_procedures
+from AmosPy.payloads import readLabelTypeFrom
+from AmosPy.procedures import list_procedures
+from AmosPy.token_reader import lineHeaderStruct, walkTokens
+
+__author__ = 'danny'
+
+CALL_GRAPH_FORMAT = 1
+CALL_TOKEN = 0x0012
+MAIN = '<main>'
+
+
+def span_calls(buf, start, end, table=None):
+    """The names called by the lines from start to end, in the order first called"""
+    table = buffer_table() if table is None else table
+    calls = []
+    offset = start
+    while offset + 2 <= end:
+        lineEnd = offset + max(lineHeaderStruct.unpack_from(buf, offset)[0] * 2, 2)
+        try:
+            for token, position, entry, size in walkTokens(buf, offset + 2, min(lineEnd, end), table):
+                if token == 0 or entry is UNKNOWN:
+                    break
+                if token == CALL_TOKEN:
+                    name = readLabelTypeFrom(buf, position + 2)[1]
+                    if name not in calls:
+                        calls.append(name)
+        except struct.error:
+            pass
+        offset = lineEnd
+    return calls
+
+
+def span_hash(buf, spans):
+    digest = hashlib.sha1()
+    for start, end in spans:
+        digest.update(buf[start:end])
+    return digest.hexdigest()
+
+
+class CallGraph(object):
+    """procedures are the names of the procedures in the order they are declared, and
+    calls maps each of them, and MAIN, to the names it calls. Calls to names no procedure
+    has are kept apart in unresolved."""
+    def __init__(self, procedures, calls):
+        self.procedures = procedures
+        declared = dict((name.upper(), name) for name in procedures)
+        self.calls = {}
+        self.unresolved = {}
+        for caller, names in calls.items():
+            resolved = self.calls[caller] = []
+            for name in names:
+                if name.upper() in declared and declared[name.upper()] not in resolved:
+                    resolved.append(declared[name.upper()])
+            missing = [name for name in names if name.upper() not in declared]
+            if missing:
+                self.unresolved[caller] = missing
+
+    @classmethod
+    def from_buffer(cls, buf, known=None):
+        """Build the graph of a whole Amos file held in a bytes-like object. known maps span
+        hashes to the calls found in them, from an earlier build; spans found there aren't walked.
+        Returns the graph, and the span hashes and calls of this file to pass in next time."""
+        buf = decrypt_procedures(buf)
+        known = {} if known is None else known
+        table = buffer_table()
+        spans = {}
+        calls = {}
+        procedures = []
+        mainSpans = []
+        offset = HEADER_SIZE
+        for procedure in list_procedures(buf):
+            mainSpans.append((offset, procedure.start))
+            offset = procedure.end
+            if procedure.name is None:
+                continue
+            key = span_hash(buf, [(procedure.start, procedure.end)])
+            if key not in known:
+                known[key] = span_calls(buf, procedure.start, procedure.end, table)
+            procedures.append(procedure.name)
+            spans[key] = calls[procedure.name] = known[key]
+        mainSpans.append((offset, HEADER_SIZE + readHeaderFrom(buf)['length']))
+        key = span_hash(buf, mainSpans)
+        if key not in known:
+            known[key] = [name for start, end in mainSpans for name in span_calls(buf, start, end, table)]
+        spans[key] = calls[MAIN] = known[key]
+        return cls(procedures, calls), spans
+
+    def callers(self, name):
+        return sorted(caller for caller, names in self.calls.items() if name in names)
+
+    def reachable(self, roots=(MAIN,)):
+        """Everything that can be reached by calls from roots, roots included"""
+        seen = set()
+        waiting = list(roots)
+        while waiting:
+            name = waiting.pop()
+            if name not in seen:
+                seen.add(name)
+                waiting.extend(self.calls.get(name, []))
+        return seen
+
+    def dead(self):
+        """The procedures the main program can never call, in the order they are declared"""
+        reachable = self.reachable()
+        return [name for name in self.procedures if name not in reachable]
+
+    def dependencies(self, name):
+        """The procedures a procedure calls, directly or not, in the order they are declared"""
+        needed = set()
+        for callee in self.calls[name]:
+            needed |= self.reachable([callee])
+        return [procedure for procedure in self.procedures if procedure in needed and procedure != name]
+
+
+class CallGraphCache(object):
+    """The calls found in each span of each file, kept in a json file per file
+    in directory, so a file's graph is rebuilt walking only the spans that are new.
+    scanned is how many spans the last graph call had to walk."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.fingerprint = 'format %d %s' % (CALL_GRAPH_FORMAT, table_fingerprint())
+        self.scanned = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, filename):
+        key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.json')
+
+    def load(self, filename):
+        try:
+            with open(self.path(filename)) as fd:
+                entry = json.load(fd)
+        except (IOError, OSError, ValueError):
+            return {}
+        return entry['spans'] if entry.get('fingerprint') == self.fingerprint else {}
+
+    def save(self, filename, spans):
+        fd, partial = tempfile.mkstemp(dir=self.directory, suffix='.partial')
+        with os.fdopen(fd, 'w') as out:
+            json.dump({'fingerprint': self.fingerprint, 'spans': spans}, out)
+        os.rename(partial, self.path(filename))
+
+    def graph(self, filename):
+        """The CallGraph of a file. Only the spans of it that have changed are walked,
+        and only the spans it has now are kept for next time."""
+        known = self.load(filename)
+        before = len(known)
+        with mapped_file(filename) as buf:
+            graph, spans = CallGraph.from_buffer(buf, known)
+        self.scanned = len(known) - before
+        self.save(filename, spans)
+        return graph
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List the procedures an Amos program never calls, "
+                                                 "or everything one procedure needs")
+    parser.add_argument('filename')
+    parser.add_argument('procedure', nargs='?', help="List the procedures this one calls, directly or not")
+    parser.add_argument('--cache', default=None, help="Directory to keep the calls of each procedure in")
+    args = parser.parse_args(argv)
+    if args.cache:
+        graph = CallGraphCache(args.cache).graph(args.filename)
+    else:
+        with mapped_file(args.filename) as buf:
+            graph = CallGraph.from_buffer(buf)[0]
+    if args.procedure is None:
+        for name in graph.dead():
+            print("%s: never called" % name)
+        for caller in sorted(graph.unresolved):
+            print("%s: calls missing %s" % (caller, ', '.join(graph.unresolved[caller])))
+        return 0
+    declared = dict((name.upper(), name) for name in graph.procedures)
+    if args.procedure.upper() not in declared:
+        print("No procedure %s in %s" % (args.procedure, args.filename))
+        return 1
+    for name in graph.dependencies(declared[args.procedure.upper()]):
+        print(name)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
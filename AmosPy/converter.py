@@ -1,10 +1,17 @@
 """Core conversion of AMOS tokens to text"""
+import mmap
 import struct
+from contextlib import contextmanager
 from AmosPy.extensions import extensions_table
-from AmosPy.token_reader import TokenReader
+from AmosPy.token_reader import TokenReader, BufferTokenReader, BadTokenRead
+
+HEADER_SIZE = 20
 
 
 def baseN(num, b, numerals="0123456789abcdefghijklmnopqrstuvwxyz"):
+    """num in base b. Negative numbers are taken as unsigned 32 bit values, as Amos holds them"""
+    if num < 0:
+        num &= 0xffffffff
     return ((num == 0) and "0") or (baseN(num // b, b).lstrip("0") + numerals[num % b])
 
 
@@ -14,12 +21,37 @@ def readHeader(byteStream):
     return {'version': version, 'length': nBytes}
 
 
+def readHeaderFrom(buf, offset=0):
+    version, nBytes = struct.unpack_from('>16sI', buf, offset)
+    return {'version': version, 'length': nBytes}
+
+
+@contextmanager
+def mapped_file(filename):
+    """Memory map a file read only. Empty files can't be mapped,
+    so they come back as an empty bytes object."""
+    with open(filename, "rb") as fd:
+        try:
+            buf = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            buf = b''
+        try:
+            yield buf
+        finally:
+            if buf:
+                buf.close()
+
+
+# Extension tokens by (extension number, token), flattened from extensions_table
+extension_names = dict(((extNo, token), name) for extNo, tokens in extensions_table.items()
+                       for token, name in tokens.items())
+
+
 def extension_str(data):
     """Handle tokens from Amos extensions"""
-    extNo, token = data
-    if extNo in extensions_table and token in extensions_table[extNo]:
-        return extensions_table[extNo][token]
-    else:
+    try:
+        return extension_names[data]
+    except KeyError:
         return "[Extension %d : 0x%04x]" % data
 
 
@@ -30,19 +62,20 @@ def procedure_str(data):
     return output
 
 
-def tokenToStr(tokenName, tokenData):
-    token_output_formats = {
-        'DecVal': lambda data: "%d" % data,
-        'HexVal': lambda data: "0x%x" % data,
-        'BinVal': lambda data: baseN(data, 2),
-        'Dbl Str': lambda data: '"%s"' % data,
-        'Variable': lambda data: data,
-        'Goto Label Ref': lambda data: data,
-        'Label': lambda data: "Label %s:" % data,
-        'Extension': extension_str,
-        'Procedure': procedure_str,
-        }
+token_output_formats = {
+    'DecVal': lambda data: "%d" % data,
+    'HexVal': lambda data: "0x%x" % (data & 0xffffffff),  # Hex and binary values show as unsigned, as Amos does
+    'BinVal': lambda data: "%" + baseN(data & 0xffffffff, 2),
+    'Dbl Str': lambda data: '"%s"' % data,
+    'Variable': lambda data: data,
+    'Goto Label Ref': lambda data: data,
+    'Label': lambda data: "Label %s:" % data,
+    'Extension': extension_str,
+    'Procedure': procedure_str,
+    }
 
+
+def tokenToStr(tokenName, tokenData):
     output = ''
     if tokenName:
         if tokenName in token_output_formats:
@@ -55,23 +88,167 @@ def tokenToStr(tokenName, tokenData):
     return str(output)
 
 
+def defaultFormat(tokenName):
+    """The formatter tokenToStr falls back to for a token with a payload: its name and the payload's repr"""
+    prefix = tokenName + " "
+    return lambda data: prefix + repr(data)
+
+
+class Renderer(object):
+    """Renders decoded lines as tokenToStr and renderLine would, but with the work done once:
+    a formatter per token name with a payload, created on first sight, prerendered indents,
+    and one list reused to assemble every line.
+    Tokens without a payload (keywords, unknown tokens) render as their name."""
+    def __init__(self, formats=token_output_formats):
+        self.formats = dict(formats)
+        self.indents = [indentLevel * ' ' for indentLevel in range(256)]
+        self.parts = []
+
+    def formatter(self, tokenName):
+        if tokenName not in self.formats:
+            self.formats[tokenName] = defaultFormat(tokenName)
+        return self.formats[tokenName]
+
+    def renderLine(self, indentLevel, tokensRead):
+        formats = self.formats
+        parts = self.parts
+        del parts[:]
+        for tokenName, tokenData in tokensRead:
+            if tokenData is None:
+                parts.append(tokenName or '')
+            else:
+                parts.append(str((formats.get(tokenName) or self.formatter(tokenName))(tokenData)))
+        return self.indents[indentLevel] + ' '.join(parts)
+
+
+renderLine = Renderer().renderLine
+
+
 class Converter(object):
-    def __init__(self):
+    """Converts Amos files into text. Give it a profiling.Profiler
+    to collect token statistics and timings as it goes.
+    When tolerant, a line that fails to decode is replaced by a placeholder
+    and decoding carries on from the next line, recording the failure in errors.
+    With decrypt set, encrypted procedures are decrypted before they are decoded."""
+    def __init__(self, profiler=None, tolerant=False, decrypt=False):
         self.bytes_read = 0
         self.unknown_tokens = 0
+        self.profiler = profiler
+        self.tolerant = tolerant
+        self.decrypt = decrypt
+        self.errors = []
 
-    def do_file(self, filename):
+    def do_file(self, filename, mapped=False):
         """Convert a file into lines of text.
         Note the file header is the first item yielded,
-        then plain text after that."""
-        tr = TokenReader()
+        then plain text after that.
+        filename can also be a readable binary file object, which is decoded with do_stream.
+        With mapped set, the file is memory mapped and decoded with do_buffer.
+        Tolerant conversion and decryption need random access, so always map the file."""
+        if hasattr(filename, 'read'):
+            for item in self.do_stream(filename):
+                yield item
+            return
+        if mapped or self.tolerant or self.decrypt:
+            with mapped_file(filename) as buf:
+                for item in self.do_buffer(buf, filename):
+                    yield item
+            return
         with open(filename, "rb") as byteStream:
-            header = readHeader(byteStream)
-            yield header
-            self.bytes_read = 0
-            while self.bytes_read < header['length']:
-                inBytesRead, indentLevel, tokensRead = tr.readTokenisedLine(byteStream)
-                self.bytes_read += inBytesRead
-                line = indentLevel * ' ' + ' '.join(tokenToStr(*token) for token in tokensRead)
-                yield line
-            self.unknown_tokens = tr.unknown_tokens
\ No newline at end of file
+            for item in self.do_stream(byteStream, filename):
+                yield item
+
+    def do_stream(self, byteStream, name=None):
+        """Convert from a readable binary file object, which needs no seeking,
+        so it can be a pipe or an archive member as it is decompressed.
+        Yields the same items as do_file. Tolerant conversion and decryption
+        need random access, so read the rest of the stream first."""
+        name = getattr(byteStream, 'name', None) if name is None else name
+        if self.tolerant or self.decrypt:
+            for item in self.do_buffer(byteStream.read(), name):
+                yield item
+            return
+        tr = TokenReader() if self.profiler is None else self.profiler.reader()
+        header = readHeader(byteStream)
+        yield header
+        for line in self.readLines(lambda: tr.readTokenisedLine(byteStream), header['length'], name):
+            yield line
+        self.unknown_tokens = tr.unknown_tokens
+
+    def do_buffer(self, buf, name=None):
+        """Convert a bytes-like object (bytes, mmap, memoryview) holding
+        a whole Amos file. Yields the same items as do_file."""
+        header = readHeaderFrom(buf)
+        yield header
+        if self.decrypt:
+            buf = self.decrypted(buf)
+        if self.profiler is None:
+            tr = BufferTokenReader(buf, HEADER_SIZE)
+        else:
+            tr = self.profiler.bufferReader(buf, HEADER_SIZE)
+        readLine = tr.readTokenisedLine
+        if self.tolerant:
+            readLine = self.tolerantReader(tr, HEADER_SIZE + header['length'])
+        for line in self.readLines(readLine, header['length'], name):
+            yield line
+        self.unknown_tokens = tr.unknown_tokens
+
+    def decrypted(self, buf):
+        """buf with its encrypted procedures decrypted. When tolerant, a file whose
+        procedures can't be found is decoded as it is."""
+        from AmosPy.decrypt import decrypt_procedures  # decrypt imports procedures, which imports this module
+        try:
+            return decrypt_procedures(buf)
+        except (BadTokenRead, struct.error):
+            if not self.tolerant:
+                raise
+            return buf
+
+    def readLines(self, readLine, length, name):
+        """Decode and render lines until length bytes of code have been read"""
+        render = renderLine
+        if self.profiler is not None:
+            self.profiler.start_file(name)
+            render = self.profiler.renderLine
+        self.bytes_read = 0
+        tolerant = self.tolerant
+        while self.bytes_read < length:
+            lineStart = HEADER_SIZE + self.bytes_read
+            inBytesRead, indentLevel, tokensRead = readLine()
+            self.bytes_read += inBytesRead
+            if tolerant:
+                yield self.tolerantRender(render, lineStart, inBytesRead, indentLevel, tokensRead)
+            else:
+                yield render(indentLevel, tokensRead)
+
+    def tolerantRender(self, render, lineStart, lineLength, indentLevel, tokensRead):
+        """Render a line, or if it fails to render, record the error and give a placeholder"""
+        try:
+            return render(indentLevel, tokensRead)
+        except Exception as error:
+            errorName = type(error).__name__
+            self.errors.append({'offset': lineStart, 'error_offset': lineStart, 'length': lineLength,
+                                'error': '%s: %s' % (errorName, (str(error).splitlines() or [''])[0])})
+            return "[Bad line at offset 0x%x: %s]" % (lineStart, errorName)
+
+    def tolerantReader(self, tr, codeEnd):
+        """Wrap a BufferTokenReader's readTokenisedLine so that a line that fails to decode
+        is skipped using its length byte, and comes back as a single placeholder token"""
+        self.errors = []
+
+        def readLine():
+            lineStart = tr.offset
+            try:
+                return tr.readTokenisedLine()
+            except (BadTokenRead, struct.error) as error:
+                if lineStart + 2 <= len(tr.buf):
+                    lineLength = max(struct.unpack_from('B', tr.buf, lineStart)[0] * 2, 2)
+                else:
+                    lineLength = max(codeEnd - lineStart, 2)  # Truncated, give up on the rest
+                errorName = 'struct.error' if isinstance(error, struct.error) else type(error).__name__
+                self.errors.append({'offset': lineStart, 'error_offset': tr.offset, 'length': lineLength,
+                                    'error': '%s: %s' % (errorName, str(error).splitlines()[0])})
+                tr.offset = lineStart + lineLength
+                placeholder = "[Bad line at offset 0x%x: %s]" % (lineStart, errorName)
+                return lineLength, 0, [(placeholder, None)]
+        return readLine
@@ -0,0 +1,67 @@
+"""Dense decode tables compiled from the token table.
+Each table is a list with an entry for every possible 16 bit token id, so
+decoding a token is a single list index rather than a dict lookup and
+type checks. Ids missing from the token table hold the UNKNOWN sentinel.
+The tables are built on first use, from the precompiled token_table when
+it is current, otherwise from amosTokens.token_map."""
+from collections import namedtuple
+from AmosPy.payloads import bufferHandler
+from AmosPy.token_table import load_token_table, token_map_entries
+
+__author__ = 'danny'
+
+# name - the token name (None for the end of line token)
+# struct - precompiled struct.Struct for fixed size payloads, else None
+# size - payload size in bytes, None when it depends on the payload itself
+# handler - reads the payload and returns (bytesRead, data), None for plain keywords
+DecodeEntry = namedtuple('DecodeEntry', 'name struct size handler')
+
+UNKNOWN = None
+TABLE_SIZE = 0x10000
+
+
+def unknownTokenName(token):
+    return "[Unknown token 0x%04x]" % token
+
+
+def compileEntry(name, handler):
+    if not handler:
+        return DecodeEntry(name, None, 0, None)
+    payload = getattr(handler, 'struct', None)
+    size = payload.size if payload is not None else None
+    return DecodeEntry(name, payload, size, handler)
+
+
+def token_entries():
+    """(token, name, stream handler) for every token"""
+    entries = load_token_table()
+    if entries is None:
+        from AmosPy.amosTokens import token_map
+        entries = token_map_entries(token_map)
+    return entries
+
+
+def compile_decode_table(entries=None, resolve=lambda handler: handler):
+    """Build a dense table from (token, name, handler) entries, by default those of the
+    token table. resolve maps each stream handler to the one the table should hold."""
+    table = [UNKNOWN] * TABLE_SIZE
+    for token, name, handler in token_entries() if entries is None else entries:
+        table[token] = compileEntry(name, resolve(handler) if handler else None)
+    return table
+
+
+_tables = {}
+
+
+def stream_table():
+    """The decode table for TokenReader, built on first use"""
+    if 'stream' not in _tables:
+        _tables['stream'] = compile_decode_table()
+    return _tables['stream']
+
+
+def buffer_table():
+    """The decode table for BufferTokenReader, built on first use"""
+    if 'buffer' not in _tables:
+        _tables['buffer'] = compile_decode_table(resolve=bufferHandler)
+    return _tables['buffer']
@@ -0,0 +1,88 @@
+"""Decrypt the bodies of encrypted procedures.
+An encrypted procedure keeps its line chain readable: in every line after
+the Procedure line, up to and including End Proc, the length and indent
+bytes and the first token are left alone, and each word after them is
+xored with a key. The key starts from the procedure's size and second seed
+byte and moves on after every word, stepping by an amount that grows by the
+first seed each time, then rotating right one bit. Running the same process
+again encrypts, so crypt_procedure does both.
+
+The key stream only depends on the seeds, not on the code, so it is made
+first, then xored over all of a procedure's encrypted words at once. Only
+the xor is vectorised, with numpy when it is installed: each key is the
+one before plus a step, rotated, so the key stream itself is made a word
+at a time in Python, and decrypting still costs about as much again as
+decoding the procedure."""
+from array import array
+from itertools import count as count_from, islice
+from AmosPy.procedures import list_procedures, lineStart
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__author__ = 'danny'
+
+ENCRYPTED_FLAG = 0x20
+FLAGS_OFFSET = 10  # From the start of the Procedure line
+FIRST_WORD_OFFSET = 4  # Of each line - past the length, indent and first token
+
+
+def key_stream(procedure, count):
+    """The count words a procedure's code is xored with. Each key depends on the one
+    before, so this is the one part done a word at a time."""
+    seed, seed2 = procedure.data['encSeed']
+    key = ((procedure.data['bytesToEnd'] << 8) | (seed2 & 0xff)) & 0xffffffff
+    keys = []
+    append = keys.append
+    # The steps are 1, 1 + seed, 1 + 2 * seed...; only their value mod 2 ** 32 matters to the key
+    for step in islice(count_from(1, seed & 0xffff), count):
+        append(key & 0xffff)
+        key = (key + step) & 0xffffffff
+        key = (key >> 1) | ((key & 1) << 31)
+    return array('H', keys)
+
+
+def encrypted_spans(buf, procedure):
+    """(start, end) of the encrypted bytes of each line of a procedure after its declaration"""
+    spans = []
+    offset = procedure.start + lineStart(buf, procedure.start)[0]
+    while offset < procedure.end:
+        lineLength = lineStart(buf, offset)[0]
+        spans.append((offset + FIRST_WORD_OFFSET, offset + lineLength))
+        offset += lineLength
+    return spans
+
+
+def crypt_procedure(data, procedure):
+    """Decrypt, or encrypt, one procedure in place in a bytearray, and flip its encrypted flag.
+    procedure is a ProcedureInfo for it, as list_procedures gives."""
+    spans = [(start, end) for start, end in encrypted_spans(data, procedure) if start < end]
+    keys = key_stream(procedure, sum(end - start for start, end in spans) // 2)
+    if numpy is not None and spans:
+        words = numpy.frombuffer(data, dtype='>u2', count=len(data) // 2)
+        index = numpy.concatenate([numpy.arange(start // 2, end // 2) for start, end in spans])
+        words[index] ^= numpy.frombuffer(keys, dtype=numpy.uint16)
+    else:
+        n = 0
+        for start, end in spans:
+            for position in range(start, end, 2):
+                data[position] ^= keys[n] >> 8
+                data[position + 1] ^= keys[n] & 0xff
+                n += 1
+    data[procedure.start + FLAGS_OFFSET] ^= ENCRYPTED_FLAG
+
+
+def decrypt_procedures(buf):
+    """A copy of a whole Amos file with its encrypted procedures decrypted, and no
+    longer flagged as encrypted. If there are none, buf itself is returned.
+    Compiled procedures are left alone, as their bodies aren't tokens anyway."""
+    encrypted = [procedure for procedure in list_procedures(buf)
+                 if 'encrypted' in procedure.flags and 'compiled' not in procedure.flags]
+    if not encrypted:
+        return buf
+    data = bytearray(buf)
+    for procedure in encrypted:
+        crypt_procedure(data, procedure)
+    return data
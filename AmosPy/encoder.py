@@ -0,0 +1,341 @@
+"""Encode text back into an Amos tokenised file - the reverse of converter.
+Text is expected in the form Converter produces: each line is its indent
+in spaces, then every token's text followed by a space. Keywords, and the
+names of extension commands, are matched longest first with a character
+trie, so 'Music Stop' wins over 'Music' and 'On Menu Del' over 'On'.
+Numbers, variable names and the payload formats of the renderer (strings,
+labels, floats, procedure flags, remarks) are parsed back into payloads.
+
+Encoding is faithful to the text, not always to the original file:
+ - names shared by several tokens (the variants of 'Add', 'Screen' etc)
+   are written as the lowest token id with that name,
+ - a name straight after Goto, Gosub, Restore, Resume or Resume Label,
+   or after a comma following one of those names (On X Goto A,B), is
+   written as a Goto Label Ref, as Amos does when it tokenises a line;
+   anywhere else a name is a Variable,
+ - the jump words after For, If, Exit and similar are left as zero, as
+   Amos recalculates them when a program is tested,
+ - a procedure's distance to its End Proc is filled in."""
+from __future__ import print_function
+import argparse
+import ast
+import io
+import re
+import struct
+from AmosPy.amosTokens import token_map
+from AmosPy.banks import banksStruct
+from AmosPy.converter import extension_names
+from AmosPy.payloads import (procedureStruct, extensionStruct, labelStruct, stringStruct, remStruct,
+                             valStruct, floatStruct, toText)
+from AmosPy.token_reader import tokenStruct, lineHeaderStruct
+
+__author__ = 'danny'
+
+DEFAULT_VERSION = b'AMOS Basic V134 '
+MAX_LINE_BYTES = 255 * 2
+END_TOKEN = tokenStruct.pack(0)
+PROCEDURE_TOKEN = 0x0376
+END_PROC_TOKEN = 0x0390
+procedureFlagBits = {'folded': 0x80, 'locked': 0x40, 'encrypted': 0x20, 'compiled': 0x10}
+VARIABLE_TOKEN, LABEL_REF_TOKEN, COMMA_TOKEN = 0x0006, 0x0018, 0x005c
+# Goto, Gosub, Restore, Resume Label, Resume - the names after them are label refs
+LABEL_REF_AFTER = (0x02a8, 0x02b2, 0x0418, 0x031e, 0x0330)
+
+# Python literals as the renderer's repr() writes them, bytes on Python 3, str on Python 2
+literalPattern = re.compile(r'''[bu]?(?:'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")''')
+# Hex and binary values are rendered unsigned, 0x... and %...
+numberPattern = re.compile(r'-?(?:0x([0-9a-f]+)|%([01]+)|(\d+))')
+namePattern = re.compile(r'[^\W\d]\w*[#$]?', re.UNICODE)
+floatPattern = re.compile(r' (-?(?:inf|nan|\d+\.?\d*(?:e[-+]?\d+)?))')
+labelPattern = re.compile(r' (\S+):')
+procedureFlagsPattern = re.compile(r' <([^>]*)>')
+extensionPattern = re.compile(r'(\d+) : 0x([0-9a-f]{4})\]')
+unknownPattern = re.compile(r'([0-9a-f]{4})\]')
+# Dbl Str is rendered '"%s"' % data - the repr of the bytes where they aren't str
+dblStrPattern = re.compile(r'(%s)"' % literalPattern.pattern if bytes is not str else r'([^"]*)"')
+
+
+class BadTokenWrite(Exception):
+    pass
+
+
+def padded(data):
+    """Payload text is padded to a word boundary"""
+    return data + b'\x00' if len(data) % 2 else data
+
+
+def labelPayload(name):
+    flags = 0
+    if name.endswith('#'):
+        flags, name = 1, name[:-1]
+    elif name.endswith('$'):
+        flags, name = 2, name[:-1]
+    name = padded(name.encode('latin-1'))
+    return labelStruct.pack(0, len(name), flags) + name
+
+
+def stringPayload(data):
+    return stringStruct.pack(len(data)) + padded(data)
+
+
+def remPayload(data):
+    data = padded(data)
+    return remStruct.pack(0, len(data)) + data
+
+
+def literalBytes(literal):
+    if '\\' not in literal:
+        return literal[literal.index(literal[-1]) + 1:-1].encode('latin-1')  # No escapes, just strip the quotes
+    value = ast.literal_eval(literal)
+    return value if isinstance(value, bytes) else value.encode('latin-1')
+
+
+# Payload parsers. Each is given the text and the position after the token's name,
+# and returns (payload, end position), or None if the text there doesn't fit.
+def plain_payload(payload):
+    return lambda text, pos: (payload, pos)
+
+
+def plain(size):
+    return plain_payload(b'\x00' * (size or 0))
+
+
+def parseWith(pattern, payload):
+    def _parse(text, pos):
+        match = pattern.match(text, pos)
+        if match is None:
+            return None
+        return payload(*match.groups()), match.end()
+    return _parse
+
+
+def parseLiteral(payload):
+    def _parse(text, pos):
+        if not text.startswith(' ', pos):
+            return None
+        match = literalPattern.match(text, pos + 1)
+        if match is None:
+            return None
+        return payload(match.group()), match.end()
+    return _parse
+
+
+def parseProcedure(text, pos):
+    flagsB = 0
+    match = procedureFlagsPattern.match(text, pos)
+    if match is not None:
+        for flag in re.findall(r"'(\w+)'", match.group(1)):
+            flagsB |= procedureFlagBits.get(flag, 0)
+        pos = match.end()
+    if flagsB & 0x80:
+        flagsB -= 0x100  # The flags byte is signed in procedureStruct
+    return procedureStruct.pack(0, 0, flagsB, 0), pos
+
+
+def parseDblStr(text, pos):
+    match = dblStrPattern.match(text, pos)
+    if match is None:
+        return None
+    data = match.group(1)
+    return stringPayload(literalBytes(data) if bytes is not str else data), match.end()
+
+
+# Parsers for tokens whose text isn't just their name, by name
+payload_parsers = {
+    'Label': parseWith(labelPattern, labelPayload),
+    'Call': parseLiteral(lambda literal: labelPayload(toText(ast.literal_eval(literal)))),
+    'Float': parseWith(floatPattern, lambda value: floatStruct.pack(float(value))),
+    'Procedure': parseProcedure,
+    'Rem': parseLiteral(lambda literal: remPayload(literalBytes(literal))),
+    "'": parseLiteral(lambda literal: remPayload(literalBytes(literal))),
+    'Sgl Str': parseLiteral(lambda literal: stringPayload(literalBytes(literal))),
+}
+
+# Tokens only written from their payload, never from their name
+payload_only = set(['Variable', 'Goto Label Ref', 'BinVal', 'HexVal', 'DecVal', 'Extension'])
+
+
+def trie_entries():
+    """(text, token, parser) for everything the trie matches. A name shared by several
+    plain keywords is written as the lowest token id, and keywords win over extensions."""
+    seen = set()
+    for token in sorted(token_map):
+        item = token_map[token]
+        name, handler = (item, None) if isinstance(item, str) else (item + (None,))[:2]
+        if not name or name in payload_only:
+            continue
+        if name == 'Dbl Str':
+            yield '"', token, parseDblStr
+        elif handler is not None and name in payload_parsers:
+            yield name, token, payload_parsers[name]
+        elif name not in seen:
+            seen.add(name)
+            yield name, token, plain(getattr(handler, 'size', 0))
+    for (extNo, extToken), name in sorted(extension_names.items()):
+        if name not in seen:
+            seen.add(name)
+            yield name, 0x004e, plain_payload(extensionStruct.pack(extNo, 0, extToken))
+    yield '[Extension ', 0x004e, parseWith(extensionPattern, lambda extNo, extToken:
+                                          extensionStruct.pack(int(extNo), 0, int(extToken, 16)))
+    # The token id is only known from the text, so this parser gives the whole token
+    yield '[Unknown token 0x', None, parseWith(unknownPattern, lambda token: tokenStruct.pack(int(token, 16)))
+
+
+def build_trie(entries):
+    """A trie of dicts keyed by character. The '' key of a node lists the
+    (token, parser) pairs for the names ending there."""
+    trie = {}
+    for text, token, parser in entries:
+        node = trie
+        for char in text:
+            node = node.setdefault(char, {})
+        node.setdefault('', []).append((token, parser))
+    return trie
+
+
+_tries = {}
+
+
+def keyword_trie():
+    """The trie of keywords and extension names, built on first use"""
+    if 'keywords' not in _tries:
+        _tries['keywords'] = build_trie(trie_entries())
+    return _tries['keywords']
+
+
+class Encoder(object):
+    """Encodes lines of text into tokenised lines, collecting them as the code section of a file"""
+    def __init__(self, version=DEFAULT_VERSION):
+        self.version = version
+        self.trie = keyword_trie()
+        self.code = bytearray()
+        self.procedure = None  # Offset in code of the payload of an open Procedure
+        self.procedure_line = None
+
+    def readToken(self, text, pos, labelRef=False):
+        """Find the longest token at pos that ends at a space or the end of the text.
+        Returns (end, token bytes), or None. Keywords win ties with numbers and names.
+        With labelRef set a name is a Goto Label Ref rather than a Variable."""
+        textLength = len(text)
+        best = None
+        node = self.trie
+        index = pos
+        while index < textLength:
+            node = node.get(text[index])
+            if node is None:
+                break
+            index += 1
+            for token, parser in node.get('', ()):
+                parsed = parser(text, index)
+                if parsed is None:
+                    continue
+                payload, end = parsed
+                if (end == textLength or text[end] == ' ') and (best is None or end > best[0]):
+                    best = (end, payload if token is None else tokenStruct.pack(token) + payload)
+        match = numberPattern.match(text, pos)
+        if match is None:
+            match = namePattern.match(text, pos)
+        if match is not None and (best is None or match.end() > best[0]):
+            end = match.end()
+            if end == textLength or text[end] == ' ':
+                best = (end, self.valueToken(match, labelRef))
+        return best
+
+    def valueToken(self, match, labelRef=False):
+        if match.re is namePattern:
+            name = match.group()
+            token = LABEL_REF_TOKEN if labelRef and name[-1] not in '#$' else VARIABLE_TOKEN
+            return tokenStruct.pack(token) + labelPayload(name)
+        hexDigits, binDigits, digits = match.groups()
+        if digits is not None:
+            value = int(digits)
+            token = 0x003e
+        else:
+            value = int(hexDigits, 16) if hexDigits is not None else int(binDigits, 2)
+            token = 0x0036 if hexDigits is not None else 0x001e
+            if value > 0xffffffff:
+                raise BadTokenWrite("Value %s is out of range" % match.group())
+            if value & 0x80000000:
+                value -= 0x100000000  # Written unsigned, but held signed like any other value
+        if match.group().startswith('-'):
+            value = -value
+        try:
+            return tokenStruct.pack(token) + valStruct.pack(value)
+        except struct.error:
+            raise BadTokenWrite("Value %s is out of range" % match.group())
+
+    def encode_line(self, text):
+        """Encode a line of text, adding it to the code. Returns the tokenised line"""
+        tokens = text.lstrip(' ')
+        indentLevel = len(text) - len(tokens)
+        lineStart = len(self.code)
+        parts = []
+        lineLength = 2
+        pos = indentLevel
+        previous = (None, None)  # The last two tokens, for telling label refs from variables
+        while pos < len(text):
+            labelRef = previous[1] in LABEL_REF_AFTER or previous == (LABEL_REF_TOKEN, COMMA_TOKEN)
+            found = self.readToken(text, pos, labelRef)
+            if found is None:
+                raise BadTokenWrite("Can't encode %r at column %d of %r" % (text[pos:pos + 20], pos, text))
+            end, tokenBytes = found
+            token = tokenStruct.unpack_from(tokenBytes)[0]
+            previous = (previous[1], token)
+            if token == PROCEDURE_TOKEN:
+                self.procedure = lineStart + lineLength + 2
+                self.procedure_line = lineStart
+            elif token == END_PROC_TOKEN and self.procedure is not None:
+                bytesToEnd = lineStart - self.procedure_line - 8
+                struct.pack_into('>i', self.code, self.procedure, bytesToEnd)
+                self.procedure = None
+            parts.append(tokenBytes)
+            lineLength += len(tokenBytes)
+            pos = end + 1
+        parts.append(END_TOKEN)
+        lineLength += 2
+        if lineLength > MAX_LINE_BYTES or indentLevel > 255:
+            raise BadTokenWrite("Line too long to encode: %r" % text)
+        line = lineHeaderStruct.pack(lineLength // 2, indentLevel) + b''.join(parts)
+        self.code += line
+        return line
+
+    def encode_lines(self, lines):
+        for line in lines:
+            self.encode_line(line)
+        return self
+
+    def file_bytes(self):
+        """The whole Amos file: header, code and an empty bank section"""
+        return (struct.pack('>16sI', self.version, len(self.code)) + bytes(self.code) +
+                banksStruct.pack(b'AmBs', 0))
+
+
+def encode(lines, version=DEFAULT_VERSION):
+    """Encode lines of text, as Converter gives them, into a whole Amos file"""
+    return Encoder(version).encode_lines(lines).file_bytes()
+
+
+def encode_file(text_filename, amos_filename, version=DEFAULT_VERSION):
+    with io.open(text_filename, encoding='latin-1') as fd:
+        data = encode((line.rstrip('\r\n') for line in fd), version)
+    with open(amos_filename, 'wb') as fd:
+        fd.write(data)
+    return len(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encode text back into an Amos tokenised file")
+    parser.add_argument('filename', help="Text, as written by amosToText")
+    parser.add_argument('-o', '--output', default=None, help="Amos file to write, by default the text file's "
+                                                                "name without .txt")
+    parser.add_argument('--version', default=DEFAULT_VERSION.decode('latin-1'), help="16 character version header")
+    args = parser.parse_args(argv)
+    output = args.output
+    if output is None:
+        output = args.filename[:-4] if args.filename.lower().endswith('.txt') else args.filename + '.AMOS'
+    written = encode_file(args.filename, output, args.version.encode('latin-1'))
+    print("Wrote", written, "bytes to", output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Structured export of a decoded program as NDJSON.
+Rather than text to be re-parsed, each line of the program becomes one
+JSON record holding its offset, indent and tokens, where every token has
+its id, name, file offset and payload as plain JSON types. The first
+record is the file header. Records are encoded one at a time and written
+through the buffered output writers, so any size of file streams in
+constant memory."""
+from __future__ import print_function
+import argparse
+import json
+import math
+import sys
+from AmosPy.converter import HEADER_SIZE, readHeaderFrom, mapped_file, extension_names
+from AmosPy.decode_table import buffer_table, unknownTokenName, UNKNOWN
+from AmosPy.output import open_output, write_lines
+from AmosPy.payloads import TextView, toText
+from AmosPy.token_reader import BufferTokenReader
+
+__author__ = 'danny'
+
+
+def jsonData(data):
+    """A payload as JSON friendly types - text for bytes, sorted lists for sets,
+    and floats JSON has no number for (nan, inf, -inf) as the text Converter gives them"""
+    if isinstance(data, (bytes, TextView)):
+        return toText(data)
+    if isinstance(data, float) and (math.isnan(data) or math.isinf(data)):
+        return str(data)
+    if isinstance(data, dict):
+        return dict((key, jsonData(value)) for key, value in data.items())
+    if isinstance(data, (set, frozenset)):
+        return sorted(data)
+    if isinstance(data, tuple):
+        return [jsonData(item) for item in data]
+    return data
+
+
+def extension_json(data):
+    extNo, extToken = data
+    return {'extension': extNo, 'token': extToken, 'name': extension_names.get(data)}
+
+
+token_json_formats = {
+    'Extension': extension_json,
+}
+
+
+class Exporter(object):
+    """Decodes a whole Amos file into line records, keeping the same counts as Converter"""
+    def __init__(self):
+        self.bytes_read = 0
+        self.unknown_tokens = 0
+        self.table = buffer_table()
+
+    def records(self, buf):
+        """Yield the header record, then a record for every line. The counts start again for each file."""
+        self.bytes_read = 0
+        self.unknown_tokens = 0
+        header = readHeaderFrom(buf)
+        yield {'version': toText(header['version']).rstrip(' \x00'), 'length': header['length']}
+        tr = BufferTokenReader(buf, HEADER_SIZE)
+        tr.table = self.table
+        tr.unknown_tokens = self.unknown_tokens
+        lineNo = 0
+        while self.bytes_read < header['length']:
+            record = self.readLine(tr)
+            self.unknown_tokens = tr.unknown_tokens
+            record['line'] = lineNo
+            lineNo += 1
+            yield record
+
+    def readLine(self, tr):
+        """The record for the line at a BufferTokenReader's cursor"""
+        lineOffset = tr.offset
+        bytesRead, indentLevel, tokens = tr.readLineTokens()
+        records = []
+        for token, offset, entry, tokenData in tokens:
+            record = {'id': token, 'offset': offset}
+            if entry is UNKNOWN:
+                record['name'] = unknownTokenName(token)
+            else:
+                record['name'] = entry.name
+                if tokenData is not None:
+                    record['data'] = token_json_formats.get(entry.name, jsonData)(tokenData)
+            records.append(record)
+        self.bytes_read += bytesRead
+        return {'offset': lineOffset, 'indent': indentLevel, 'tokens': records}
+
+
+_encoder = json.JSONEncoder(separators=(',', ':'), allow_nan=False)
+
+
+def ndjson_lines(records):
+    """Encode each record as it is needed, one JSON document per line"""
+    encode = _encoder.encode
+    for record in records:
+        yield encode(record)
+
+
+def export_file(filename, output='-', summary=sys.stderr):
+    """Write the NDJSON export of an Amos file to output, returning the Exporter"""
+    exporter = Exporter()
+    with mapped_file(filename) as buf:
+        sink = open_output(output)
+        try:
+            write_lines(ndjson_lines(exporter.records(buf)), sink, 'ascii')
+        finally:
+            if output not in (None, '-'):
+                sink.close()
+    print("Code Bytes read", exporter.bytes_read, file=summary)
+    if exporter.unknown_tokens:
+        print("Found %d unknown tokens" % exporter.unknown_tokens, file=summary)
+    return exporter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export an Amos tokenised file as NDJSON, one record per line")
+    parser.add_argument('filename')
+    parser.add_argument('-o', '--output', default='-', help="Output file, - for stdout. .gz/.xz are compressed")
+    args = parser.parse_args(argv)
+    export_file(args.filename, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Random access to the lines of an Amos program.
+Every tokenised line starts with its length in words, so the line
+boundaries can be found by following that chain without decoding any
+tokens. The resulting index lets single lines, or ranges of them, be
+decoded on their own. A saved index records the size and crc of the file
+it was built from, and its offsets are little endian whatever the host."""
+import os
+import struct
+import sys
+import zlib
+from array import array
+from AmosPy.converter import HEADER_SIZE, readHeaderFrom, renderLine
+from AmosPy.token_reader import BufferTokenReader
+
+__author__ = 'danny'
+
+INDEX_MAGIC = b'AmLi'
+INDEX_FORMAT = 2
+# Magic, format, code length, file size, crc32 of the file, line count
+indexHeaderStruct = struct.Struct('<4sIIIII')
+
+
+def buffer_crc(buf):
+    return zlib.crc32(buf) & 0xffffffff
+
+
+def little_endian(offsets):
+    """offsets, or a byteswapped copy of them on a big endian host. Swapping is its own inverse."""
+    if sys.byteorder == 'little':
+        return offsets
+    offsets = array('I', offsets)
+    offsets.byteswap()
+    return offsets
+
+
+def scan_lines(buf, start, end):
+    """Follow the line length chain from start to end, returning the line offsets.
+    A zero length line still takes up its 2 byte header, as it does when decoding."""
+    offsets = array('I')
+    offset = start
+    while offset < end:
+        offsets.append(offset)
+        offset += max(struct.unpack_from('B', buf, offset)[0] * 2, 2)
+    return offsets
+
+
+class LineIndex(object):
+    """Offsets of each line in a whole Amos file. The offsets are into the file,
+    so the code section starts at HEADER_SIZE."""
+    def __init__(self, offsets, length, size=0, crc=0):
+        self.offsets = offsets
+        self.length = length
+        self.size = size  # Of the file it was built from, with its crc, so a saved index can be checked
+        self.crc = crc
+
+    @classmethod
+    def build(cls, buf):
+        length = readHeaderFrom(buf)['length']
+        return cls(scan_lines(buf, HEADER_SIZE, HEADER_SIZE + length), length, len(buf), buffer_crc(buf))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def span(self, lineNo):
+        """The (start, end) offsets of a line"""
+        end = self.offsets[lineNo + 1] if lineNo + 1 < len(self.offsets) else HEADER_SIZE + self.length
+        return self.offsets[lineNo], end
+
+    def decode_tokens(self, buf, start, stop=None):
+        """Yield (indentLevel, tokensRead) for lines start to stop, as a slice would"""
+        start, stop, step = slice(start, stop).indices(len(self.offsets))
+        if start >= stop:
+            return
+        tr = BufferTokenReader(buf, self.offsets[start])
+        for lineNo in range(start, stop):
+            tr.offset = self.offsets[lineNo]
+            inBytesRead, indentLevel, tokensRead = tr.readTokenisedLine()
+            yield indentLevel, tokensRead
+
+    def decode_lines(self, buf, start, stop=None):
+        """Yield the text of lines start to stop"""
+        for indentLevel, tokensRead in self.decode_tokens(buf, start, stop):
+            yield renderLine(indentLevel, tokensRead)
+
+    def decode_line(self, buf, lineNo):
+        if lineNo < 0:
+            lineNo += len(self.offsets)
+        if not 0 <= lineNo < len(self.offsets):
+            raise IndexError("line %d out of range" % lineNo)
+        return next(self.decode_lines(buf, lineNo, lineNo + 1))
+
+    def save(self, filename):
+        with open(filename, 'wb') as fd:
+            fd.write(indexHeaderStruct.pack(INDEX_MAGIC, INDEX_FORMAT, self.length, self.size, self.crc,
+                                            len(self.offsets)))
+            little_endian(self.offsets).tofile(fd)
+
+    @classmethod
+    def load(cls, filename, buf=None):
+        """Load a saved index. Given buf, the file it should index, an index
+        of anything else raises ValueError."""
+        with open(filename, 'rb') as fd:
+            magic, version, length, size, crc, count = indexHeaderStruct.unpack(fd.read(indexHeaderStruct.size))
+            if magic != INDEX_MAGIC or version != INDEX_FORMAT:
+                raise ValueError("%s is not a line index" % filename)
+            if buf is not None and (size, crc) != (len(buf), buffer_crc(buf)):
+                raise ValueError("%s is the line index of a different file" % filename)
+            offsets = array('I')
+            offsets.fromfile(fd, count)
+        return cls(little_endian(offsets), length, size, crc)
+
+    @classmethod
+    def cached(cls, buf, filename, index_filename):
+        """Load the index for filename from index_filename if it is newer and was
+        built from the same bytes as buf, otherwise build it from buf and save it there."""
+        if os.path.exists(index_filename) and os.path.getmtime(index_filename) >= os.path.getmtime(filename):
+            try:
+                return cls.load(index_filename, buf)
+            except (ValueError, EOFError, struct.error):
+                pass
+        index = cls.build(buf)
+        index.save(index_filename)
+        return index
@@ -0,0 +1,184 @@
+"""A persistent index of the names used across a collection of Amos files.
+The names in Variable, Label, Call and Goto Label Ref tokens, and the names
+procedures are declared with, are stored in an sqlite database with the
+file and line they appear on, so questions like "which programs call
+procedure X" are a single indexed query rather than a decode of every file.
+Only those payloads are decoded; other tokens are stepped over by size.
+Updating the index looks at each file's size and mtime, then its hash,
+and only reads files that have really changed."""
+from __future__ import print_function
+import argparse
+import glob
+import hashlib
+import os
+import sqlite3
+import struct
+import sys
+from AmosPy.batch import find_amos_files
+from AmosPy.cache import table_fingerprint
+from AmosPy.converter import HEADER_SIZE, mapped_file, readHeaderFrom
+from AmosPy.decode_table import buffer_table, UNKNOWN
+from AmosPy.payloads import readLabelTypeFrom
+from AmosPy.procedures import PROCEDURE_TOKEN
+from AmosPy.token_reader import lineHeaderStruct, walkTokens
+
+__author__ = 'danny'
+
+INDEX_FORMAT = 1
+LABEL_KINDS = {0x0006: 'Variable', 0x000c: 'Label', 0x0012: 'Call', 0x0018: 'Goto Label Ref'}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime REAL, size INTEGER, hash TEXT);
+CREATE TABLE IF NOT EXISTS names (file INTEGER, line INTEGER, kind TEXT, name TEXT COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS names_by_name ON names (name, kind);
+CREATE INDEX IF NOT EXISTS names_by_file ON names (file);
+"""
+
+
+def identifiers(buf):
+    """Yield (lineNo, kind, name) for the names in a whole Amos file.
+    A line that can't be walked is skipped from the first token that can't be read."""
+    table = buffer_table()
+    codeEnd = min(HEADER_SIZE + readHeaderFrom(buf)['length'], len(buf))
+    offset = HEADER_SIZE
+    lineNo = 0
+    while offset + 2 <= codeEnd:
+        lineEnd = offset + max(lineHeaderStruct.unpack_from(buf, offset)[0] * 2, 2)
+        previous = None
+        try:
+            for token, position, entry, size in walkTokens(buf, offset + 2, lineEnd, table):
+                if token == 0 or entry is UNKNOWN:
+                    break
+                if token in LABEL_KINDS:
+                    name = readLabelTypeFrom(buf, position + 2)[1]
+                    yield lineNo, 'Procedure' if previous == PROCEDURE_TOKEN else LABEL_KINDS[token], name
+                previous = token
+        except struct.error:
+            pass
+        offset = lineEnd
+        lineNo += 1
+
+
+def file_hash(buf):
+    return hashlib.sha1(buf).hexdigest()
+
+
+class NameIndex(object):
+    """The index database at path, created if it doesn't exist. An index made
+    with different token tables or an older format is emptied and rebuilt."""
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        version = 'format %d %s' % (INDEX_FORMAT, table_fingerprint())
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != version:
+            with self.db:
+                self.db.execute("DELETE FROM names")
+                self.db.execute("DELETE FROM files")
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+
+    def close(self):
+        self.db.close()
+
+    def update(self, paths):
+        """Bring the index up to date with the Amos files found under paths
+        (files, directories or glob patterns). Files that have gone from under
+        the given directories are removed, as are files that can no longer be read,
+        which are counted as failed. Returns counts of what was done."""
+        counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+        found = set()
+        roots = [os.path.join(os.path.abspath(path), '') for pattern in paths
+                 for path in glob.glob(pattern) or [pattern] if os.path.isdir(path)]
+        with self.db:
+            for source, root in find_amos_files(paths):
+                source = os.path.abspath(source)
+                try:
+                    counts[self.update_file(source)] += 1
+                except (IOError, OSError):
+                    # Gone or unreadable since it was found, which fails on its own rather than stopping the update
+                    counts['failed'] += 1
+                    continue
+                found.add(source)
+            for fileId, path in self.db.execute("SELECT id, path FROM files").fetchall():
+                if path not in found and any(path.startswith(root) for root in roots):
+                    self.remove_file(fileId)
+                    counts['removed'] += 1
+        return counts
+
+    def update_file(self, path):
+        """Index one file if it has changed. Returns 'added', 'updated' or 'unchanged'"""
+        stat = os.stat(path)
+        row = self.db.execute("SELECT id, mtime, size, hash FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[1] == stat.st_mtime and row[2] == stat.st_size:
+            return 'unchanged'
+        with mapped_file(path) as buf:
+            digest = file_hash(buf)
+            if row is not None and row[3] == digest:
+                self.db.execute("UPDATE files SET mtime = ?, size = ? WHERE id = ?", (stat.st_mtime, stat.st_size,
+                                                                                    row[0]))
+                return 'unchanged'
+            names = set(identifiers(buf)) if len(buf) >= HEADER_SIZE else set()
+        if row is None:
+            fileId = self.db.execute("INSERT INTO files (path, mtime, size, hash) VALUES (?, ?, ?, ?)",
+                                     (path, stat.st_mtime, stat.st_size, digest)).lastrowid
+        else:
+            fileId = row[0]
+            self.db.execute("DELETE FROM names WHERE file = ?", (fileId,))
+            self.db.execute("UPDATE files SET mtime = ?, size = ?, hash = ? WHERE id = ?",
+                            (stat.st_mtime, stat.st_size, digest, fileId))
+        self.db.executemany("INSERT INTO names VALUES (?, ?, ?, ?)",
+                            ((fileId, lineNo, kind, name) for lineNo, kind, name in sorted(names)))
+        return 'added' if row is None else 'updated'
+
+    def remove_file(self, fileId):
+        self.db.execute("DELETE FROM names WHERE file = ?", (fileId,))
+        self.db.execute("DELETE FROM files WHERE id = ?", (fileId,))
+
+    def find(self, name, kind=None):
+        """(path, line, kind) for every use of a name, ignoring case as Amos does"""
+        query = "SELECT path, line, kind FROM names JOIN files ON files.id = names.file WHERE name = ?"
+        args = (name,)
+        if kind is not None:
+            query += " AND kind = ?"
+            args += (kind,)
+        return self.db.execute(query + " ORDER BY path, line", args).fetchall()
+
+    def files_with(self, name, kind=None):
+        """The paths of the files using a name, for instance the programs
+        calling a procedure with files_with(name, 'Call')"""
+        return sorted(set(path for path, line, kind in self.find(name, kind)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index the names used in Amos files, and search the index")
+    parser.add_argument('index', help="The index database file")
+    commands = parser.add_subparsers(dest='command')
+    update = commands.add_parser('update', help="Add new and changed files to the index")
+    update.add_argument('paths', nargs='+', help="Amos files, directories or glob patterns")
+    find = commands.add_parser('find', help="List where a name is used")
+    find.add_argument('name')
+    find.add_argument('-k', '--kind', choices=sorted(set(LABEL_KINDS.values())) + ['Procedure'], default=None)
+    find.add_argument('-l', '--files', action='store_true', help="Only list the files")
+    args = parser.parse_args(argv)
+    index = NameIndex(args.index)
+    try:
+        if args.command == 'update':
+            print("%(added)d added, %(updated)d updated, %(unchanged)d unchanged, %(removed)d removed, "
+                  "%(failed)d failed" % index.update(args.paths))
+        elif args.command == 'find':
+            if args.files:
+                for path in index.files_with(args.name, args.kind):
+                    print(path)
+            else:
+                for path, line, kind in index.find(args.name, args.kind):
+                    print("%s:%d: %s" % (path, line + 1, kind))
+        else:
+            parser.print_usage()
+            return 1
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
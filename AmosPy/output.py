@@ -0,0 +1,91 @@
+"""Streaming output of converted lines.
+Lines are gathered into large chunks, encoded, and written to a binary
+sink in one call per chunk, so memory use stays constant however long
+the program is. Text sinks (sys.stdout on Python 3, io.StringIO) are
+given the chunks as text instead. The sink itself is only flushed at the
+end, so a compressed sink isn't forced to end a block at every chunk. Sinks can be stdout, plain files, or gzip/xz compressed
+files, chosen by the file extension."""
+import gzip
+import io
+import sys
+
+__author__ = 'danny'
+
+BUFFER_SIZE = 1 << 16
+DEFAULT_ENCODING = 'latin-1'  # The Amiga character set
+COMPRESSED_EXTENSIONS = {'.gz': 'gz', '.xz': 'xz'}
+
+
+def compression_for(path):
+    for extension, compression in COMPRESSED_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def stdout_binary():
+    return getattr(sys.stdout, 'buffer', sys.stdout)
+
+
+def open_output(path, compression=None):
+    """Open a binary sink. path '-' (or None) is stdout. compression is 'gz', 'xz'
+    or None, and by default follows the extension of path."""
+    if path in (None, '-'):
+        return stdout_binary()
+    if compression is None:
+        compression = compression_for(path)
+    if compression == 'gz':
+        return gzip.open(path, 'wb')
+    if compression == 'xz':
+        try:
+            import lzma
+        except ImportError:
+            raise ValueError("xz output needs the lzma module (Python 3.3+)")
+        return lzma.open(path, 'wb')
+    return io.open(path, 'wb', buffering=BUFFER_SIZE)
+
+
+class LineWriter(object):
+    """Writes lines to a binary or text sink in chunks of about buffer_size characters"""
+    def __init__(self, sink, encoding=DEFAULT_ENCODING, buffer_size=BUFFER_SIZE):
+        self.sink = sink
+        self.text = isinstance(sink, io.TextIOBase)
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        self.chunk = []
+        self.size = 0
+        self.lines = 0
+
+    def write(self, line):
+        self.chunk.append(line)
+        self.chunk.append('\n')
+        self.size += len(line) + 1
+        self.lines += 1
+        if self.size >= self.buffer_size:
+            self.writeChunk()
+
+    def writeChunk(self):
+        if self.chunk:
+            text = ''.join(self.chunk)
+            if self.text:
+                self.sink.write(text.decode(self.encoding, 'replace') if isinstance(text, bytes) else text)
+            else:
+                self.sink.write(text.encode(self.encoding, 'replace') if not isinstance(text, bytes) else text)
+            del self.chunk[:]
+            self.size = 0
+
+    def flush(self):
+        """Write out what is left, and flush the sink"""
+        self.writeChunk()
+        self.sink.flush()
+
+
+def write_lines(lines, sink, encoding=DEFAULT_ENCODING, buffer_size=BUFFER_SIZE):
+    """Write every line from an iterable to a binary or text sink, returning how many were written"""
+    writer = LineWriter(sink, encoding, buffer_size)
+    try:
+        for line in lines:
+            writer.write(line)
+    finally:
+        writer.flush()
+    return writer.lines
@@ -0,0 +1,111 @@
+"""Decoding one large Amos file on several processes.
+The line length chain is scanned first to find line boundaries, the code
+section is cut into chunks of whole lines, and each chunk is decoded and
+rendered by a worker that maps the file itself. Results come back in
+order. Each worker checks it finished exactly at the end of its chunk, as
+decoding one line after another would have; if not, the rest of the file
+is decoded in order here, so the lines and counts always match Converter."""
+import struct
+from multiprocessing import Pool, cpu_count
+from AmosPy.converter import HEADER_SIZE, mapped_file, readHeaderFrom, renderLine
+from AmosPy.line_index import scan_lines
+from AmosPy.token_reader import BadTokenRead, BufferTokenReader
+
+__author__ = 'danny'
+
+MIN_CHUNK_BYTES = 1 << 16
+CHUNKS_PER_JOB = 4
+
+
+def chunk_bounds(offsets, end, chunk_bytes):
+    """Cut a list of line offsets into (start, end) spans of about chunk_bytes"""
+    bounds = []
+    start = offsets[0] if len(offsets) else end
+    for offset in offsets:
+        if offset - start >= chunk_bytes:
+            bounds.append((start, offset))
+            start = offset
+    if start < end:
+        bounds.append((start, end))
+    return bounds
+
+
+def decode_span(buf, start, end):
+    """Decode and render lines from start until end is reached.
+    Returns (lines, bytesRead, unknownTokens, offset the decoding stopped at)"""
+    tr = BufferTokenReader(buf, start)
+    lines = []
+    while tr.offset < end:
+        inBytesRead, indentLevel, tokensRead = tr.readTokenisedLine()
+        lines.append(renderLine(indentLevel, tokensRead))
+    return lines, tr.offset - start, tr.unknown_tokens, tr.offset
+
+
+def decode_chunk(job):
+    filename, start, end = job
+    with mapped_file(filename) as buf:
+        return decode_span(buf, start, end)
+
+
+class ParallelConverter(object):
+    """Converts one file on a pool of jobs processes (default: one per cpu), yielding the
+    same items as Converter.do_file and keeping the same bytes_read and unknown_tokens.
+    Files too small to split are converted in this process."""
+    def __init__(self, jobs=None, chunk_bytes=None):
+        self.jobs = jobs or cpu_count()
+        self.chunk_bytes = chunk_bytes
+        self.bytes_read = 0
+        self.unknown_tokens = 0
+
+    def chunks(self, buf, length):
+        """Chunk bounds for the code, as far as the file really goes. In a truncated file the
+        line chain runs out before the code length, and whatever is past the last chunk is
+        decoded in order, failing where Converter would."""
+        chunk_bytes = self.chunk_bytes or max(MIN_CHUNK_BYTES, length // (self.jobs * CHUNKS_PER_JOB))
+        end = min(HEADER_SIZE + length, len(buf))
+        return chunk_bounds(scan_lines(buf, HEADER_SIZE, end), end, chunk_bytes)
+
+    def do_file(self, filename):
+        with mapped_file(filename) as buf:
+            header = readHeaderFrom(buf)
+            yield header
+            codeEnd = HEADER_SIZE + header['length']
+            self.bytes_read = 0
+            unknownTotal = 0  # Like Converter, unknown_tokens is only set once the whole file decodes
+            bounds = self.chunks(buf, header['length']) if self.jobs > 1 else []
+            offset = HEADER_SIZE
+            if len(bounds) > 1:
+                for result in self.decode_chunks(filename, bounds):
+                    if result is None:
+                        break  # Decode this chunk again here, to give its lines up to the error
+                    lines, bytesRead, unknownTokens, offset = result
+                    self.bytes_read += bytesRead
+                    unknownTotal += unknownTokens
+                    for line in lines:
+                        yield line
+            # Whatever the chunks didn't cover - all of a small file, or everything after
+            # a chunk that failed or overran its end, so that the chunks after it started in the wrong place
+            tr = BufferTokenReader(buf, offset)
+            while tr.offset < codeEnd:
+                inBytesRead, indentLevel, tokensRead = tr.readTokenisedLine()
+                self.bytes_read += inBytesRead
+                yield renderLine(indentLevel, tokensRead)
+            self.unknown_tokens = unknownTotal + tr.unknown_tokens
+
+    def decode_chunks(self, filename, bounds):
+        """Yield each chunk's results in order, stopping after any chunk that didn't finish
+        where the next one starts. A chunk that failed to decode gives None."""
+        pool = Pool(self.jobs)
+        try:
+            results = pool.imap(decode_chunk, [(filename, start, end) for start, end in bounds])
+            for start, end in bounds:
+                try:
+                    result = next(results)
+                except (BadTokenRead, struct.error):
+                    result = None
+                yield result
+                if result is None or result[3] != end:
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
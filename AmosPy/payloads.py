@@ -0,0 +1,277 @@
+"""Readers for the payloads that follow some tokens - the special cases of the token table."""
+import struct
+
+# Precompiled payload layouts, shared by the stream and buffer handlers
+remStruct = struct.Struct('bb')
+valStruct = struct.Struct('>i')
+floatStruct = struct.Struct('>f')
+labelStruct = struct.Struct('Hbb')
+stringStruct = struct.Struct('>h')
+procedureStruct = struct.Struct('>ihbb')
+extensionStruct = struct.Struct('>2bH')
+
+
+def toText(raw):
+    """Payload bytes as a native string. Amiga text is treated as latin-1"""
+    if isinstance(raw, str):
+        return raw
+    if isinstance(raw, TextView):
+        raw = raw.tobytes()
+    return raw.decode('latin-1')
+
+
+class TextView(object):
+    """A string or remark payload left where it is in the buffer, only copied out
+    (and its NUL padding stripped) when it is used. It compares, hashes, prints and
+    reprs as the bytes readString and readRem give, so rendering is unchanged.
+    A view is only valid while its buffer is - for a mapped file, until it is closed."""
+    __slots__ = ('buf', 'offset', 'length')
+
+    def __init__(self, buf, offset, length):
+        self.buf = buf
+        self.offset = offset
+        self.length = length
+
+    def tobytes(self):
+        return bytes(self.buf[self.offset:self.offset + self.length]).rstrip(b"\x00")
+
+    def __str__(self):
+        return str(self.tobytes())
+
+    def __repr__(self):
+        return repr(self.tobytes())
+
+    def __eq__(self, other):
+        if isinstance(other, TextView):
+            other = other.tobytes()
+        return self.tobytes() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.tobytes())
+
+    def __len__(self):
+        return len(self.tobytes())
+
+
+def readRem(byteStream):
+    """The rem - remark/comment type tokens"""
+    commentLength = remStruct.unpack(byteStream.read(2))[1]
+    bytesRead = 2
+    comment = struct.unpack('%ds' % commentLength, byteStream.read(commentLength))[0].rstrip(b"\x00")
+    bytesRead += commentLength
+    return bytesRead, comment
+
+
+def readVal(byteStream):
+    """Values - all seem to be 4 bytes long"""
+    intVal = valStruct.unpack(byteStream.read(4))[0]
+    return 4, intVal
+
+
+def readFloatVal(byteStream):
+    """Read a floating point value"""
+    floatVal = floatStruct.unpack(byteStream.read(4))[0]
+    return 4, floatVal
+
+
+def readLabelType(byteStream):
+    """Labels - for goto, variables, procedure calls etc"""
+    bytesRead = 0
+    unknown, length, flags = labelStruct.unpack(byteStream.read(4))
+    bytesRead += 4
+    name = toText(struct.unpack("%ds" % length, byteStream.read(length))[0].rstrip(b"\x00"))
+    if flags & 1:
+        name += "#"  # Floats in amos
+    elif flags and 2:
+        name += "$"
+    bytesRead += length
+    return bytesRead, name
+
+
+def unknownSize(size):
+    """Some tokens have an 'unknown' extra bytes. Make sure to eat them"""
+    def _read(byteStream):
+        byteStream.read(size)
+        return size, None
+    _read.size = size
+    _read.struct = struct.Struct('%dx' % size)
+    return _read
+
+
+def readString(byteStream):
+    """String constants"""
+    bytesRead = 0
+    length = stringStruct.unpack(byteStream.read(2))[0]
+    bytesRead += 2
+    #Round to next word boundary
+    if length % 2:
+        length += 1
+    unpacked = struct.unpack("%ds" % length, byteStream.read(length))
+    data = unpacked[0].rstrip(b"\x00")
+    bytesRead += length
+    return bytesRead, data
+
+
+def readProcedure(byteStream):
+    """This is the procedure declaration. So far - nothing can be done for a compiled or encrypted one"""
+    bytesRead = 0
+    bytesToEnd, encSeed, flagsB, encSeed2 = procedureStruct.unpack(byteStream.read(8))
+    bytesRead += 8
+    flags = procedureFlags(flagsB)
+    if 'compiled' in flags:
+        byteStream.read(bytesToEnd)
+        bytesRead += bytesToEnd
+    return bytesRead, {'bytesToEnd': bytesToEnd, 'encSeed': (encSeed, encSeed2), 'flags': flags}
+
+
+def readExtension(byteStream):
+    """An extension token. For now - look in extensions.py for their mappings"""
+    extNo, unused, extToken = extensionStruct.unpack(byteStream.read(4))
+    return 4, (extNo, extToken)
+
+
+def procedureFlags(flagsB):
+    """Turn the flags byte of a procedure declaration into a set of names"""
+    flags = set()
+    if flagsB & 2 ** 7:
+        flags.add('folded')
+    if flagsB & 2 ** 6:
+        flags.add('locked')
+    if flagsB & 2 ** 5:
+        flags.add('encrypted')
+    if flagsB & 2 ** 4:
+        flags.add('compiled')
+    return flags
+
+
+# Buffer based versions of the above. These take a bytes-like object (bytes, mmap, memoryview)
+# and an offset into it, and return the same (bytesRead, data) pairs as the stream versions,
+# except that strings and remarks come back as TextViews into the buffer.
+def readRemFrom(buf, offset):
+    commentLength = remStruct.unpack_from(buf, offset)[1]
+    if commentLength < 0 or offset + 2 + commentLength > len(buf):
+        raise struct.error("Remark of %d bytes runs past the buffer" % commentLength)
+    return 2 + commentLength, TextView(buf, offset + 2, commentLength)
+
+
+def readValFrom(buf, offset):
+    return 4, valStruct.unpack_from(buf, offset)[0]
+
+
+def readFloatValFrom(buf, offset):
+    return 4, floatStruct.unpack_from(buf, offset)[0]
+
+
+def readLabelTypeFrom(buf, offset):
+    unknown, length, flags = labelStruct.unpack_from(buf, offset)
+    checkedSize(buf, offset, 4, length, "Name")
+    name = toText(struct.unpack_from("%ds" % length, buf, offset + 4)[0].rstrip(b"\x00"))
+    if flags & 1:
+        name += "#"  # Floats in amos
+    elif flags and 2:
+        name += "$"
+    return 4 + length, name
+
+
+def unknownSizeFrom(size):
+    def _read(buf, offset):
+        return size, None
+    _read.size = size
+    _read.struct = struct.Struct('%dx' % size)
+    return _read
+
+
+def readStringFrom(buf, offset):
+    length = stringStruct.unpack_from(buf, offset)[0]
+    #Round to next word boundary
+    if length % 2:
+        length += 1
+    if length < 0 or offset + 2 + length > len(buf):
+        raise struct.error("String of %d bytes runs past the buffer" % length)
+    return 2 + length, TextView(buf, offset + 2, length)
+
+
+def readProcedureFrom(buf, offset):
+    bytesToEnd, encSeed, flagsB, encSeed2 = procedureStruct.unpack_from(buf, offset)
+    bytesRead = 8
+    flags = procedureFlags(flagsB)
+    if 'compiled' in flags:
+        bytesRead = checkedSize(buf, offset, 8, bytesToEnd, "Compiled procedure")
+    return bytesRead, {'bytesToEnd': bytesToEnd, 'encSeed': (encSeed, encSeed2), 'flags': flags}
+
+
+def readExtensionFrom(buf, offset):
+    extNo, unused, extToken = extensionStruct.unpack_from(buf, offset)
+    return 4, (extNo, extToken)
+
+
+# Payload sizes, for walking tokens without decoding them. By buffer handler,
+# for those whose size depends on the payload.
+def checkedSize(buf, offset, fixed, length, kind):
+    """The size of a payload at offset with fixed bytes before its length bytes of data.
+    A negative length, or one running past the buffer, raises struct.error,
+    so a walk over damaged data can never stand still or step back."""
+    if length < 0 or offset + fixed + length > len(buf):
+        raise struct.error("%s of %d bytes at offset %d runs outside the buffer" % (kind, length, offset))
+    return fixed + length
+
+
+def remSizeFrom(buf, offset):
+    return checkedSize(buf, offset, 2, remStruct.unpack_from(buf, offset)[1], "Remark")
+
+
+def labelTypeSizeFrom(buf, offset):
+    return checkedSize(buf, offset, 4, labelStruct.unpack_from(buf, offset)[1], "Name")
+
+
+def stringSizeFrom(buf, offset):
+    length = stringStruct.unpack_from(buf, offset)[0]
+    return checkedSize(buf, offset, 2, length + length % 2, "String")
+
+
+def procedureSizeFrom(buf, offset):
+    bytesToEnd, encSeed, flagsB, encSeed2 = procedureStruct.unpack_from(buf, offset)
+    return checkedSize(buf, offset, 8, bytesToEnd if flagsB & 2 ** 4 else 0, "Compiled procedure")
+
+
+payload_sizes = {
+    readRemFrom: remSizeFrom,
+    readLabelTypeFrom: labelTypeSizeFrom,
+    readStringFrom: stringSizeFrom,
+    readProcedureFrom: procedureSizeFrom,
+}
+
+
+# Fixed size payloads carry their layout, so a decode table can know their size up front
+for _handler, _struct in ((readVal, valStruct), (readValFrom, valStruct),
+                          (readFloatVal, floatStruct), (readFloatValFrom, floatStruct),
+                          (readExtension, extensionStruct), (readExtensionFrom, extensionStruct)):
+    _handler.struct = _struct
+
+
+def handlerName(handler):
+    """A readable name for a handler, including the size for unknownSize ones"""
+    if hasattr(handler, 'size'):
+        return 'unknownSize(%d)' % handler.size
+    return handler.__name__
+
+
+def bufferHandler(handler):
+    """Find the buffer based equivalent of a stream handler from token_map"""
+    if hasattr(handler, 'size'):
+        return unknownSizeFrom(handler.size)
+    return buffer_handlers[handler]
+
+
+buffer_handlers = {
+    readRem: readRemFrom,
+    readVal: readValFrom,
+    readFloatVal: readFloatValFrom,
+    readLabelType: readLabelTypeFrom,
+    readString: readStringFrom,
+    readProcedure: readProcedureFrom,
+    readExtension: readExtensionFrom,
+}
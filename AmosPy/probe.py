@@ -0,0 +1,81 @@
+"""Quick triage of Amos files from their fixed size regions alone.
+The 20 byte header gives the version and code length, and the 6 bytes
+after the code say whether banks follow and how many, so a file can be
+classified with two small reads and no decoding. Files are probed on a
+pool of threads, as the work is almost all waiting on the disk."""
+from __future__ import print_function
+import os
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from AmosPy.banks import banksStruct
+from AmosPy.converter import HEADER_SIZE, readHeaderFrom
+
+__author__ = 'danny'
+
+PROBE_THREADS = 16
+HUNK_HEADER = b'\x00\x00\x03\xf3'  # Amiga executables, which is what the Amos compiler makes
+
+# kind - 'AMOS 1.3', 'AMOS Pro', 'compiled' or 'not-AMOS'
+# version - the 16 character version string, length - the code length from the header
+# banks - how many banks follow the code, None if there is no bank section
+HeaderInfo = namedtuple('HeaderInfo', 'filename kind version length banks size error')
+
+
+def version_kind(head):
+    if head.startswith(b'AMOS Pro'):
+        return 'AMOS Pro'
+    if head.startswith(b'AMOS Basic'):
+        return 'AMOS 1.3'
+    if head.startswith(HUNK_HEADER):
+        return 'compiled'
+    return 'not-AMOS'
+
+
+def probe(filename):
+    """Classify a file from its header and the bank section marker after its code"""
+    try:
+        with open(filename, 'rb') as fd:
+            size = os.fstat(fd.fileno()).st_size
+            head = fd.read(HEADER_SIZE)
+            kind = version_kind(head)
+            if kind not in ('AMOS 1.3', 'AMOS Pro') or len(head) < HEADER_SIZE:
+                return HeaderInfo(filename, kind, None, None, None, size, None)
+            header = readHeaderFrom(head)
+            version = header['version'].decode('latin-1').rstrip(' \x00')
+            codeEnd = HEADER_SIZE + header['length']
+            if codeEnd > size:
+                return HeaderInfo(filename, kind, version, header['length'], None, size, "truncated")
+            fd.seek(codeEnd)
+            tail = fd.read(banksStruct.size)
+    except (IOError, OSError) as error:
+        return HeaderInfo(filename, None, None, None, None, None, str(error))
+    banks = None
+    if len(tail) == banksStruct.size:
+        magic, count = banksStruct.unpack(tail)
+        if magic == b'AmBs':
+            banks = count
+    return HeaderInfo(filename, kind, version, header['length'], banks, size, None)
+
+
+def probe_all(filenames, threads=PROBE_THREADS):
+    """Probe many files concurrently, yielding a HeaderInfo for each in order"""
+    pool = ThreadPool(threads)
+    try:
+        for info in pool.imap(probe, filenames, 16):
+            yield info
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def format_info(info):
+    banks = '-' if info.banks is None else str(info.banks)
+    length = '-' if info.length is None else str(info.length)
+    line = "%-9s %-16s %9s %5s  %s" % (info.kind or 'error', info.version or '', length, banks, info.filename)
+    if info.error:
+        line += "  (%s)" % info.error
+    return line
+
+
+def format_header():
+    return "%-9s %-16s %9s %5s  %s" % ('Kind', 'Version', 'Code', 'Banks', 'File')
@@ -0,0 +1,109 @@
+"""Procedure level access to an Amos program.
+The Procedure token's payload holds the number of bytes to its End Proc
+line (counted from just after that field, 8 bytes into the line), so the
+procedures can be listed by hopping from declaration to End Proc without
+decoding their bodies, and any one of them decoded on its own."""
+from __future__ import print_function
+import struct
+import sys
+from collections import namedtuple
+from AmosPy.payloads import readProcedureFrom, readLabelTypeFrom
+from AmosPy.converter import HEADER_SIZE, mapped_file, readHeaderFrom, renderLine
+from AmosPy.token_reader import BufferTokenReader, BadTokenRead
+
+__author__ = 'danny'
+
+PROCEDURE_TOKEN = 0x0376
+END_PROC_TOKEN = 0x0390
+LABEL_TOKENS = (0x0006, 0x000c, 0x0012, 0x0018)
+END_PROC_BASE = 8
+
+lineStartStruct = struct.Struct('>BBH')
+
+# start/end are the file offsets of the Procedure line and just past the End Proc line.
+# data is the Procedure token's payload, as readProcedure returns it.
+ProcedureInfo = namedtuple('ProcedureInfo', 'name flags start end data')
+
+
+def lineStart(buf, offset):
+    """The length in bytes and first token of the line at offset"""
+    words, indentLevel, token = lineStartStruct.unpack_from(buf, offset)
+    return max(words * 2, 2), token
+
+
+def findEndProc(buf, offset, end):
+    """Walk the line chain from offset looking for an End Proc line"""
+    while offset < end:
+        lineLength, token = lineStart(buf, offset)
+        if token == END_PROC_TOKEN:
+            return offset
+        offset += lineLength
+    raise BadTokenRead("No End Proc found before offset %d" % end)
+
+
+def readProcedureLine(buf, offset, end):
+    """Describe the procedure declared on the line at offset"""
+    bytesRead, data = readProcedureFrom(buf, offset + 4)
+    nameOffset = offset + 4 + 8
+    name = None
+    if struct.unpack_from('>H', buf, nameOffset)[0] in LABEL_TOKENS:
+        name = readLabelTypeFrom(buf, nameOffset + 2)[1]
+    lineLength = lineStart(buf, offset)[0]
+    endProc = offset + END_PROC_BASE + data['bytesToEnd']
+    # Trust the stored offset only if it really lands on an End Proc line
+    if not (offset + lineLength <= endProc < end and lineStart(buf, endProc)[1] == END_PROC_TOKEN):
+        endProc = findEndProc(buf, offset + lineLength, end)
+    return ProcedureInfo(name, data['flags'], offset, endProc + lineStart(buf, endProc)[0], data)
+
+
+def list_procedures(buf):
+    """List the procedures in a whole Amos file held in a bytes-like object,
+    skipping over their bodies"""
+    offset = HEADER_SIZE
+    end = HEADER_SIZE + readHeaderFrom(buf)['length']
+    procedures = []
+    while offset < end:
+        lineLength, token = lineStart(buf, offset)
+        if token == PROCEDURE_TOKEN:
+            procedure = readProcedureLine(buf, offset, end)
+            procedures.append(procedure)
+            offset = procedure.end
+        else:
+            offset += lineLength
+    return procedures
+
+
+def decode_procedure(buf, procedure):
+    """Yield the lines of text of one procedure, from Procedure to End Proc"""
+    tr = BufferTokenReader(buf, procedure.start)
+    while tr.offset < procedure.end:
+        inBytesRead, indentLevel, tokensRead = tr.readTokenisedLine()
+        yield renderLine(indentLevel, tokensRead)
+
+
+def extract_procedures(buf, names):
+    """Yield (procedure, lines) for just the named procedures"""
+    for procedure in list_procedures(buf):
+        if procedure.name in names:
+            yield procedure, list(decode_procedure(buf, procedure))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("Usage: procedures.py amos_file [procedure_name ...]")
+        return 1
+    with mapped_file(argv[0]) as buf:
+        if len(argv) == 1:
+            for procedure in list_procedures(buf):
+                print("%s: bytes %d-%d %s" % (procedure.name, procedure.start, procedure.end,
+                                              ' '.join(sorted(procedure.flags))))
+            return 0
+        for procedure, lines in extract_procedures(buf, argv[1:]):
+            for line in lines:
+                print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Optional instrumentation of decoding and rendering.
+A Profiler counts occurrences and bytes per token id, times each payload
+handler and each token's rendering, and times decode and render per file.
+Converter only uses the profiling readers when given a Profiler, so
+nothing here costs anything when profiling is off."""
+import json
+from collections import defaultdict
+from timeit import default_timer
+from AmosPy.payloads import handlerName
+from AmosPy.converter import Renderer
+from AmosPy.decode_table import stream_table, buffer_table, unknownTokenName, UNKNOWN
+from AmosPy.token_reader import TokenReader, BufferTokenReader, tokenStruct
+
+__author__ = 'danny'
+
+
+class Profiler(object):
+    def __init__(self, clock=default_timer):
+        self.clock = clock
+        self.token_counts = defaultdict(int)
+        self.token_bytes = defaultdict(int)
+        self.handler_calls = defaultdict(int)
+        self.handler_times = defaultdict(float)
+        self.formatter_calls = defaultdict(int)
+        self.formatter_times = defaultdict(float)
+        self.files = []
+        self.current = None
+        self.tables = {}
+        self.renderer = Renderer()
+
+    def timed(self, handler):
+        """Wrap a payload handler so its calls are counted and timed"""
+        name = handlerName(handler)
+        clock, calls, times = self.clock, self.handler_calls, self.handler_times
+
+        def _timed(*args):
+            start = clock()
+            result = handler(*args)
+            times[name] += clock() - start
+            calls[name] += 1
+            return result
+        return _timed
+
+    def table(self, table):
+        """A copy of a decode table with timed handlers"""
+        if id(table) not in self.tables:
+            self.tables[id(table)] = [entry if entry is UNKNOWN or entry.handler is None
+                                      else entry._replace(handler=self.timed(entry.handler))
+                                      for entry in table]
+        return self.tables[id(table)]
+
+    def reader(self):
+        return ProfilingTokenReader(self)
+
+    def bufferReader(self, buf, offset):
+        return ProfilingBufferTokenReader(buf, offset, self)
+
+    def countToken(self, token, bytesRead):
+        self.token_counts[token] += 1
+        self.token_bytes[token] += bytesRead
+
+    def start_file(self, name):
+        self.current = {'name': name, 'decode_time': 0.0, 'render_time': 0.0, 'lines': 0}
+        self.files.append(self.current)
+
+    def renderLine(self, indentLevel, tokensRead):
+        """Renderer.renderLine, timing each token's rendering through the same formatters"""
+        clock, calls, times = self.clock, self.formatter_calls, self.formatter_times
+        formats, formatter = self.renderer.formats, self.renderer.formatter
+        lineStart = clock()
+        parts = []
+        for tokenName, tokenData in tokensRead:
+            start = clock()
+            if tokenData is None:
+                parts.append(tokenName or '')
+            else:
+                parts.append(str((formats.get(tokenName) or formatter(tokenName))(tokenData)))
+            times[tokenName] += clock() - start
+            calls[tokenName] += 1
+        line = self.renderer.indents[indentLevel] + ' '.join(parts)
+        if self.current is not None:
+            self.current['render_time'] += clock() - lineStart
+            self.current['lines'] += 1
+        return line
+
+    def as_dict(self):
+        def tokenName(token):
+            entry = buffer_table()[token]
+            return unknownTokenName(token) if entry is UNKNOWN else entry.name
+        return {
+            'tokens': [{'id': token, 'name': tokenName(token), 'count': self.token_counts[token],
+                        'bytes': self.token_bytes[token]} for token in sorted(self.token_counts)],
+            'handlers': dict((name, {'calls': self.handler_calls[name], 'seconds': self.handler_times[name]})
+                             for name in self.handler_calls),
+            'formatters': dict((str(name), {'calls': self.formatter_calls[name],
+                                            'seconds': self.formatter_times[name]})
+                               for name in self.formatter_calls),
+            'files': self.files,
+        }
+
+    def merge(self, profile):
+        """Add in the results of another profile, in as_dict form"""
+        for token in profile['tokens']:
+            self.token_counts[token['id']] += token['count']
+            self.token_bytes[token['id']] += token['bytes']
+        for name, stats in profile['handlers'].items():
+            self.handler_calls[name] += stats['calls']
+            self.handler_times[name] += stats['seconds']
+        for name, stats in profile['formatters'].items():
+            self.formatter_calls[name] += stats['calls']
+            self.formatter_times[name] += stats['seconds']
+        self.files.extend(profile['files'])
+
+    def write_json(self, fd):
+        json.dump(self.as_dict(), fd, indent=1, sort_keys=True)
+
+
+class ProfilingTokenReader(TokenReader):
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.table = profiler.table(stream_table())
+
+    def readToken(self, byteStream):
+        token = tokenStruct.unpack(byteStream.read(2))[0]
+        entry = self.table[token]
+        bytesRead, tokenName, tokenData = 2, None, None
+        if entry is UNKNOWN:
+            self.unknown_tokens += 1
+            tokenName = unknownTokenName(token)
+        else:
+            tokenName = entry.name
+            if entry.handler is not None:
+                inBytesRead, tokenData = entry.handler(byteStream)
+                bytesRead += inBytesRead
+        self.profiler.countToken(token, bytesRead)
+        return bytesRead, tokenName, tokenData
+
+    def readTokenisedLine(self, byteStream):
+        start = self.profiler.clock()
+        result = TokenReader.readTokenisedLine(self, byteStream)
+        if self.profiler.current is not None:
+            self.profiler.current['decode_time'] += self.profiler.clock() - start
+        return result
+
+
+class ProfilingBufferTokenReader(BufferTokenReader):
+    def __init__(self, buf, offset, profiler):
+        BufferTokenReader.__init__(self, buf, offset)
+        self.profiler = profiler
+        self.table = profiler.table(buffer_table())
+
+    def readToken(self):
+        result = BufferTokenReader.readToken(self)
+        self.profiler.countToken(result[1], result[0])
+        return result
+
+    def readTokenisedLine(self):
+        start = self.profiler.clock()
+        result = BufferTokenReader.readTokenisedLine(self)
+        if self.profiler.current is not None:
+            self.profiler.current['decode_time'] += self.profiler.clock() - start
+        return result
@@ -4,8 +4,12 @@ represent the data required from it.
 This was a script used in the production of amosTokens.py.
 """
 from __future__ import print_function
+import sys
 from re import match, search
 from AmosPy.amosTokens import token_map
+from AmosPy.payloads import handlerName
+from AmosPy.token_table import (TOKEN_TABLE_PATH, TOKEN_SOURCE_PATH, dump_token_table, load_token_table,
+                                source_hash, token_map_entries)
 
 
 def capitalize_all(line):
@@ -70,13 +74,35 @@ def convert_to_dict(new_pairs):
     pair_list = sorted(pair_list, key=lambda item: item[0])
     for key, value in pair_list:
         if isinstance(value, tuple):
-            value = (value[0], value[1].func_name)
+            value = (value[0], handlerName(value[1]))
             print("0x%04x: ('%s', %s)," % (key, value[0], value[1]))
         else:
             print("0x%04x: %s," % (key, repr(value)))
 
 
+def write_token_table(path=TOKEN_TABLE_PATH, tokens=token_map):
+    """Save the precompiled token table that token_table.load_token_table reads"""
+    with open(path, 'wb') as fd:
+        dump_token_table(token_map_entries(tokens), fd, source_hash(TOKEN_SOURCE_PATH))
+    return verify_token_table(path, tokens)
+
+
+def describe(entries):
+    return [(token, name, handlerName(handler) if handler else None) for token, name, handler in entries]
+
+
+def verify_token_table(path=TOKEN_TABLE_PATH, tokens=token_map):
+    """Check the precompiled token table is current and matches the token map entry for entry"""
+    entries = load_token_table(path)
+    return entries is not None and describe(entries) == describe(token_map_entries(tokens))
+
+
 if __name__ == '__main__':
-    with open("toktabparsed.txt") as fd:
-        lines, new_pairs, non_tokens = get_tokens(fd.readlines())
-    convert_to_dict(new_pairs)
\ No newline at end of file
+    if sys.argv[1:] == ['--table']:
+        # After changing amosTokens.py, regenerate amosTokens.tab
+        if not write_token_table():
+            sys.exit("The written token table does not match amosTokens.token_map")
+    else:
+        with open("toktabparsed.txt") as fd:
+            lines, new_pairs, non_tokens = get_tokens(fd.readlines())
+        convert_to_dict(new_pairs)
\ No newline at end of file
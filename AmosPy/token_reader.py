@@ -1,37 +1,55 @@
 import struct
-from AmosPy.amosTokens import token_map
+from AmosPy.decode_table import stream_table, buffer_table, unknownTokenName, UNKNOWN
+from AmosPy.payloads import payload_sizes
 
 __author__ = 'danny'
 
+tokenStruct = struct.Struct('>H')
+lineHeaderStruct = struct.Struct('BB')
+
 
 class BadTokenRead(Exception):
     pass
 
 
+def walkTokens(buf, offset, lineEnd, table):
+    """Yield (token, offset, entry, payload size) for the tokens from offset, stepping over
+    payloads by size rather than decoding them, until the end of line token or lineEnd.
+    entry is UNKNOWN for an unknown token id, which is taken to have no payload.
+    A payload size that can't be read, or is negative, raises struct.error."""
+    while offset + 2 <= lineEnd:
+        token = tokenStruct.unpack_from(buf, offset)[0]
+        entry = table[token]
+        size = 0
+        if entry is not UNKNOWN:
+            size = entry.size
+            if size is None:
+                size = payload_sizes[entry.handler](buf, offset + 2)
+        yield token, offset, entry, size
+        if token == 0:
+            return
+        offset += 2 + size
+
+
 class TokenReader(object):
     unknown_tokens = 0
 
+    def __init__(self):
+        self.table = stream_table()
+
     def readToken(self, byteStream):
-        token = struct.unpack('>H', byteStream.read(2))[0]
-        bytesRead = 2
-        tokenData = None
-        try:
-            tokenInfo = token_map[token]
-            if type(tokenInfo) == str:
-                tokenName = tokenInfo
-            else:
-                if len(tokenInfo) > 1 and tokenInfo[1]:
-                    inBytesRead, tokenData = tokenInfo[1](byteStream)
-                    bytesRead += inBytesRead
-                tokenName = tokenInfo[0]
-        except KeyError:
-            tokenName = "[Unknown token 0x%04x]" % token
+        token = tokenStruct.unpack(byteStream.read(2))[0]
+        entry = self.table[token]
+        if entry is UNKNOWN:
             self.unknown_tokens += 1
-            tokenData = None
-        return bytesRead, tokenName, tokenData
+            return 2, unknownTokenName(token), None
+        if entry.handler is None:
+            return 2, entry.name, None
+        inBytesRead, tokenData = entry.handler(byteStream)
+        return 2 + inBytesRead, entry.name, tokenData
 
     def readTokenisedLine(self, byteStream):
-        lineLength, indentLevel = struct.unpack('BB', byteStream.read(2))
+        lineLength, indentLevel = lineHeaderStruct.unpack(byteStream.read(2))
         lineLength *= 2
         bytesRead = 2
         tokensRead = []
@@ -44,4 +62,58 @@ class TokenReader(object):
                                                                                  lineLength, repr(tokensRead)))
             if tokenName is None:
                 break
-        return bytesRead, indentLevel, tokensRead
\ No newline at end of file
+        return bytesRead, indentLevel, tokensRead
+
+
+class BufferTokenReader(object):
+    """Reads tokens from a bytes-like object (bytes, mmap, memoryview),
+    walking it with an offset cursor instead of reading from a stream."""
+    def __init__(self, buf, offset=0):
+        self.buf = buf
+        self.offset = offset
+        self.unknown_tokens = 0
+        self.table = buffer_table()
+
+    def readToken(self):
+        """Read the token at the cursor. Returns (bytesRead, token, entry, tokenData),
+        entry being UNKNOWN for an unknown token id"""
+        offset = self.offset + 2
+        token = tokenStruct.unpack_from(self.buf, self.offset)[0]
+        entry = self.table[token]
+        if entry is UNKNOWN:
+            self.offset = offset
+            self.unknown_tokens += 1
+            return 2, token, entry, None
+        if entry.handler is None:
+            self.offset = offset
+            return 2, token, entry, None
+        inBytesRead, tokenData = entry.handler(self.buf, offset)
+        self.offset = offset + inBytesRead
+        return 2 + inBytesRead, token, entry, tokenData
+
+    def readLineTokens(self):
+        """Decode the line at the cursor, leaving it at the next line.
+        Returns (bytesRead, indentLevel, tokens), tokens being (token, offset, entry, tokenData)
+        for each token, up to and including the end of line token.
+        This is the one line decoding loop; readTokenisedLine, TokenStream and Exporter all use it."""
+        lineLength, indentLevel = lineHeaderStruct.unpack_from(self.buf, self.offset)
+        self.offset += 2
+        lineLength *= 2
+        bytesRead = 2
+        tokens = []
+        while bytesRead < lineLength:
+            offset = self.offset
+            inBytesRead, token, entry, tokenData = self.readToken()
+            bytesRead += inBytesRead
+            tokens.append((token, offset, entry, tokenData))
+            if bytesRead > lineLength:
+                raise BadTokenRead("Read %d bytes, expected %d, at offset %d" % (bytesRead, lineLength, self.offset))
+            if token == 0:
+                break
+        return bytesRead, indentLevel, tokens
+
+    def readTokenisedLine(self):
+        """Decode the line at the cursor into (tokenName, tokenData) pairs"""
+        bytesRead, indentLevel, tokens = self.readLineTokens()
+        return bytesRead, indentLevel, [(unknownTokenName(token) if entry is UNKNOWN else entry.name, tokenData)
+                                        for token, offset, entry, tokenData in tokens]
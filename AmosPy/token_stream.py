@@ -0,0 +1,99 @@
+"""A compact, column based representation of a decoded program.
+Rather than a list of (tokenName, tokenData) tuples per line, token ids
+and their offsets in the file are held in arrays, with the payloads that
+decode to something kept once each in a side table of literals.
+Names are only looked up when rendering."""
+from array import array
+from AmosPy.converter import HEADER_SIZE, readHeaderFrom, renderLine
+from AmosPy.payloads import TextView
+from AmosPy.decode_table import buffer_table, unknownTokenName, UNKNOWN
+from AmosPy.token_reader import BufferTokenReader
+
+__author__ = 'danny'
+
+
+class TokenStream(object):
+    def __init__(self):
+        self.ids = array('H')
+        self.offsets = array('I')  # File offset of each token; its payload follows 2 bytes later
+        self.line_starts = array('I')  # Index into ids of the first token of each line
+        self.line_offsets = array('I')
+        self.indents = array('B')
+        self.literal_refs = array('i')  # Index into literals of each token's payload, -1 for none
+        self.literals = []  # Distinct decoded payloads
+        self.literal_index = {}
+        self.bytes_read = 0
+        self.unknown_tokens = 0
+
+    @classmethod
+    def from_buffer(cls, buf, table=None):
+        """Decode the code section of a whole Amos file held in a bytes-like object"""
+        stream = cls()
+        tr = BufferTokenReader(buf, HEADER_SIZE)
+        if table is not None:
+            tr.table = table
+        end = HEADER_SIZE + readHeaderFrom(buf)['length']
+        while stream.bytes_read < end - HEADER_SIZE:
+            stream.readLine(tr)
+        stream.unknown_tokens = tr.unknown_tokens
+        return stream
+
+    def readLine(self, tr):
+        """Decode the line at a BufferTokenReader's cursor into the columns"""
+        lineOffset = tr.offset
+        bytesRead, indentLevel, tokens = tr.readLineTokens()
+        self.line_starts.append(len(self.ids))
+        self.line_offsets.append(lineOffset)
+        self.indents.append(indentLevel)
+        ids, offsets, literal_refs = self.ids, self.offsets, self.literal_refs
+        for token, offset, entry, tokenData in tokens:
+            ids.append(token)
+            offsets.append(offset)
+            literal_refs.append(-1 if tokenData is None else self.addLiteral(tokenData))
+        self.bytes_read += bytesRead
+
+    def addLiteral(self, tokenData):
+        """Store a payload in the literal table, sharing repeated values.
+        Floats aren't shared, as 0.0 == -0.0 but they render differently.
+        Text is copied out of the buffer, so the stream outlives it"""
+        if isinstance(tokenData, TextView):
+            tokenData = tokenData.tobytes()
+        key = (type(tokenData), tokenData)
+        literal = len(self.literals)
+        if not isinstance(tokenData, float):
+            try:
+                literal = self.literal_index.setdefault(key, literal)
+            except TypeError:
+                pass  # Unhashable, such as procedure details
+        if literal == len(self.literals):
+            self.literals.append(tokenData)
+        return literal
+
+    def literal(self, index):
+        """The decoded payload of the token at index, or None"""
+        literal = self.literal_refs[index]
+        return None if literal < 0 else self.literals[literal]
+
+    def __len__(self):
+        return len(self.line_starts)
+
+    def token_range(self, lineNo):
+        start = self.line_starts[lineNo]
+        stop = self.line_starts[lineNo + 1] if lineNo + 1 < len(self.line_starts) else len(self.ids)
+        return start, stop
+
+    def name(self, index):
+        entry = buffer_table()[self.ids[index]]
+        return unknownTokenName(self.ids[index]) if entry is UNKNOWN else entry.name
+
+    def tokens(self, lineNo):
+        """The (tokenName, tokenData) pairs of a line, as TokenReader gives them"""
+        start, stop = self.token_range(lineNo)
+        return [(self.name(index), self.literal(index)) for index in range(start, stop)]
+
+    def render_line(self, lineNo):
+        return renderLine(self.indents[lineNo], self.tokens(lineNo))
+
+    def render(self):
+        for lineNo in range(len(self)):
+            yield self.render_line(lineNo)
@@ -0,0 +1,110 @@
+"""A precompiled form of amosTokens.token_map.
+Without writable bytecode caches, importing amosTokens means compiling its
+large dict literal every time, which dominates start up of short lived
+processes. read_parse_toktab.write_token_table saves the table as arrays of
+ids, handler indexes and names, along with the size and crc32 of amosTokens.py.
+It is only used while those still match the source."""
+import binascii
+import os
+import struct
+import sys
+from array import array
+from AmosPy import payloads
+
+__author__ = 'danny'
+
+TOKEN_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'amosTokens.tab')
+TOKEN_SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'amosTokens.py')
+TABLE_MAGIC = b'AmTk'
+tableHeaderStruct = struct.Struct('<4sHIIHII')
+
+
+def source_hash(path=TOKEN_SOURCE_PATH):
+    """The size and crc32 of the token source"""
+    with open(path, 'rb') as fd:
+        source = fd.read()
+    return len(source), binascii.crc32(source) & 0xffffffff
+
+
+def handlerFromName(name):
+    """The payload handler a payloads.handlerName refers to"""
+    if name.startswith('unknownSize('):
+        return payloads.unknownSize(int(name[len('unknownSize('):-1]))
+    return getattr(payloads, name)
+
+
+def token_map_entries(tokens):
+    """(token, name, handler) for each entry of a token map, in token order"""
+    entries = []
+    for token in sorted(tokens):
+        tokenInfo = tokens[token]
+        if isinstance(tokenInfo, str):
+            entries.append((token, tokenInfo, None))
+        else:
+            entries.append((token, tokenInfo[0], tokenInfo[1] if len(tokenInfo) > 1 else None))
+    return entries
+
+
+def arrayToBytes(values):
+    """Array contents as little endian bytes"""
+    values = array(values.typecode, values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+
+def arrayFromBytes(typecode, data):
+    values = array(typecode)
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def dump_token_table(entries, fd, sourceHash):
+    handlerNames = []
+    ids, handlers = array('H'), array('B')
+    names = []
+    for token, name, handler in entries:
+        ids.append(token)
+        names.append(name or '')
+        if handler:
+            if payloads.handlerName(handler) not in handlerNames:
+                handlerNames.append(payloads.handlerName(handler))
+            handlers.append(handlerNames.index(payloads.handlerName(handler)) + 1)
+        else:
+            handlers.append(0)
+    text = '\n'.join(handlerNames + names).encode('latin-1')
+    fd.write(tableHeaderStruct.pack(TABLE_MAGIC, 1, sourceHash[0], sourceHash[1], len(handlerNames), len(ids),
+                                    len(text)))
+    fd.write(arrayToBytes(ids))
+    fd.write(arrayToBytes(handlers))
+    fd.write(text)
+
+
+def load_token_table(path=TOKEN_TABLE_PATH, sourcePath=TOKEN_SOURCE_PATH):
+    """Read the precompiled table into a list of (token, name, handler).
+    Returns None if it is missing, or was made from a different amosTokens.py."""
+    try:
+        with open(path, 'rb') as fd:
+            data = fd.read()
+        sourceHash = source_hash(sourcePath)
+    except (IOError, OSError):
+        return None
+    if len(data) < tableHeaderStruct.size:
+        return None
+    magic, version, sourceSize, sourceCrc, handlerCount, count, textLength = tableHeaderStruct.unpack_from(data)
+    if magic != TABLE_MAGIC or version != 1 or (sourceSize, sourceCrc) != sourceHash:
+        return None
+    offset = tableHeaderStruct.size
+    ids = arrayFromBytes('H', data[offset:offset + count * 2])
+    offset += count * 2
+    handlers = arrayFromBytes('B', data[offset:offset + count])
+    offset += count
+    text = payloads.toText(data[offset:offset + textLength]).split('\n')
+    handlerFunctions = [None] + [handlerFromName(name) for name in text[:handlerCount]]
+    names = [name or None for name in text[handlerCount:]]
+    return list(zip(ids, names, [handlerFunctions[handler] for handler in handlers]))
@@ -0,0 +1,80 @@
+"""Structural checks of Amos files, without decoding them to text.
+The line length chain and each token's payload size are enough to tell
+whether the code section is intact: every line's tokens must end with the
+end of line token exactly where its length byte says, every token id must
+be known, and the lines must add up to the code length in the header.
+No names, strings or text are built along the way."""
+import struct
+from collections import namedtuple
+from AmosPy.converter import HEADER_SIZE, mapped_file, readHeaderFrom
+from AmosPy.decode_table import buffer_table, UNKNOWN
+from AmosPy.token_reader import tokenStruct, lineHeaderStruct, walkTokens
+
+__author__ = 'danny'
+
+# lines, tokens - how many were checked. offset - where the first problem is, None if there isn't one
+Verification = namedtuple('Verification', 'lines tokens offset error')
+
+
+class BadStructure(Exception):
+    def __init__(self, offset, error):
+        Exception.__init__(self, "%s at offset 0x%x" % (error, offset))
+        self.offset = offset
+        self.error = error
+
+
+def verifyLine(buf, offset, lineEnd, table):
+    """Walk the tokens of the line whose tokens start at offset. Returns how many there were"""
+    tokens = 0
+    position = offset  # Of the token being walked
+    try:
+        for token, position, entry, size in walkTokens(buf, offset, lineEnd, table):
+            if entry is UNKNOWN:
+                raise BadStructure(position, "Unknown token 0x%04x" % token)
+            tokens += 1
+            if token == 0:
+                if position + 2 != lineEnd:
+                    raise BadStructure(position + 2, "End of line token %d bytes before the line's end"
+                                       % (lineEnd - position - 2))
+                return tokens
+            if position + 2 + size > lineEnd:
+                raise BadStructure(position, "Token 0x%04x runs past the end of the line at 0x%x" % (token, lineEnd))
+            position += 2 + size
+    except struct.error as error:
+        if position + 2 > len(buf):
+            raise
+        token = tokenStruct.unpack_from(buf, position)[0]
+        raise BadStructure(position, "Token 0x%04x has a bad payload: %s" % (token, error))
+    raise BadStructure(position, "No end of line token before the line's end at 0x%x" % lineEnd)
+
+
+def verify_buffer(buf):
+    """Check the structure of a whole Amos file held in a bytes-like object"""
+    lines = tokens = 0
+    offset = 0
+    table = buffer_table()
+    try:
+        if len(buf) < HEADER_SIZE:
+            raise BadStructure(len(buf), "File is shorter than its header")
+        codeEnd = HEADER_SIZE + readHeaderFrom(buf)['length']
+        offset = HEADER_SIZE
+        while offset < codeEnd:
+            lineLength = lineHeaderStruct.unpack_from(buf, offset)[0] * 2
+            if lineLength == 0:
+                raise BadStructure(offset, "Line with no length")
+            lineEnd = offset + lineLength
+            if lineEnd > codeEnd:
+                raise BadStructure(offset, "Line runs %d bytes past the end of the code" % (lineEnd - codeEnd))
+            tokens += verifyLine(buf, offset + 2, lineEnd, table)
+            lines += 1
+            offset = lineEnd
+    except BadStructure as failure:
+        return Verification(lines, tokens, failure.offset, failure.error)
+    except struct.error:
+        return Verification(lines, tokens, offset, "File ends inside the code")
+    return Verification(lines, tokens, None, None)
+
+
+def verify_file(filename):
+    with mapped_file(filename) as buf:
+        return verify_buffer(buf)
@@ -0,0 +1,9 @@
+"""Convert whole directories (or glob patterns) of amos tokenised
+files into plain text, using a pool of worker processes.
+Run with --help for the options."""
+import sys
+from AmosPy.batch import main
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,25 +1,49 @@
 """Main script of this package - this will convert
 an amos tokenised file into plain text, which should be
 a representation of what you'd have seen in the Amos editor
-window."""
+window. The text goes to stdout or a file (.gz and .xz are
+compressed), and the summary statistics go to stderr."""
 from __future__ import print_function
+import argparse
 import sys
 from AmosPy.converter import Converter
+from AmosPy.output import DEFAULT_ENCODING, open_output, write_lines
 
 
-def output_file(filename):
-    converter = Converter()
-    items = converter.do_file(filename)
+def output_file(filename, output='-', summary=sys.stderr, encoding=DEFAULT_ENCODING, jobs=1, decrypt=False):
+    if jobs == 1 or decrypt:
+        converter = Converter(decrypt=decrypt)
+        items = converter.do_file(filename, mapped=True)
+    else:
+        from AmosPy.parallel import ParallelConverter
+        converter = ParallelConverter(jobs)
+        items = converter.do_file(filename)
     header = next(items)
+    sink = open_output(output)
     try:
-        [print(line) for line in items]
+        write_lines(items, sink, encoding)
     finally:
-        print("Code Bytes read", converter.bytes_read, "of", header['length'])
+        if output not in (None, '-'):
+            sink.close()
+        print("Code Bytes read", converter.bytes_read, "of", header['length'], file=summary)
         if converter.unknown_tokens:
-            print("Found %d unknown tokens" % converter.unknown_tokens)
+            print("Found %d unknown tokens" % converter.unknown_tokens, file=summary)
     if converter.unknown_tokens == 0 and converter.bytes_read == header['length']:
-        print("All tokens translated")
+        print("All tokens translated", file=summary)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert an Amos tokenised file to text")
+    parser.add_argument('filename')
+    parser.add_argument('-o', '--output', default='-', help="Output file, - for stdout. .gz/.xz are compressed")
+    parser.add_argument('--encoding', default=DEFAULT_ENCODING, help="Text encoding of the output")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Decode a large file on this many processes, 0 for one per cpu")
+    parser.add_argument('-d', '--decrypt', action='store_true',
+                        help="Decrypt encrypted procedures (the file is then decoded on one process)")
+    args = parser.parse_args(argv)
+    output_file(args.filename, args.output, encoding=args.encoding, jobs=args.jobs or None, decrypt=args.decrypt)
 
 
 if __name__ == '__main__':
-    output_file(sys.argv[1])
+    main()
@@ -0,0 +1,85 @@
+"""Helpers to build small tokenised Amos programs for the tests"""
+import struct
+
+__author__ = 'danny'
+
+
+def token(tokenId, payload=b''):
+    return struct.pack('>H', tokenId) + payload
+
+
+def label(tokenId, name, flags=0):
+    name = name.encode('ascii')
+    if len(name) % 2:
+        name += b'\x00'
+    return token(tokenId, struct.pack('>Hbb', 0, len(name), flags) + name)
+
+
+def variable(name, flags=0):
+    return label(0x0006, name, flags)
+
+
+def decval(value):
+    return token(0x003e, struct.pack('>i', value))
+
+
+def dblstr(text):
+    text = text.encode('ascii')
+    padded = text + b'\x00' * (len(text) % 2)
+    return token(0x0026, struct.pack('>h', len(text)) + padded)
+
+
+def rem(text):
+    text = text.encode('ascii')
+    if len(text) % 2:
+        text += b'\x00'
+    return token(0x064a, struct.pack('bb', 0, len(text)) + text)
+
+
+def extension(extNo, extToken):
+    return token(0x004e, struct.pack('>2bH', extNo, 0, extToken))
+
+
+def procedure(bytesToEnd, flags=0, seed=0, seed2=0):
+    return token(0x0376, struct.pack('>ihBB', bytesToEnd, seed, flags, seed2))
+
+
+def line(indent, *tokens):
+    body = b''.join(tokens) + token(0x0000)
+    return struct.pack('BB', (len(body) + 2) // 2, indent) + body
+
+
+def program(*lines, **kwargs):
+    code = b''.join(lines)
+    version = kwargs.get('version', b'AMOS Basic V134 ')
+    return struct.pack('>16sI', version, len(code)) + code + kwargs.get('trailer', b'')
+
+
+def sample_program():
+    """A short program using most of the payload token kinds"""
+    return program(
+        line(1, variable('A'), token(0xffa2), decval(10)),
+        line(1, token(0x0476), dblstr('Hello')),
+        line(1, rem('a comment')),
+        line(1, extension(1, 0x0058), decval(1)),
+        line(1, token(0x0476), variable('A'), token(0xffc0), decval(-3)),
+        line(1, token(0x0476), token(0x1234)),
+    )
+
+
+def procedure_lines(name, body, flags=0):
+    """A procedure declaration, its body lines and End Proc, with bytesToEnd filled in"""
+    declaration = line(0, procedure(0, flags), variable(name))
+    bytesToEnd = len(declaration) + len(b''.join(body)) - 8
+    declaration = line(0, procedure(bytesToEnd, flags), variable(name))
+    return [declaration] + list(body) + [line(0, token(0x0390))]
+
+
+def procedure_program():
+    """A main program calling two procedures"""
+    return program(*(
+        [line(0, label(0x0012, 'FIRST')),
+         line(0, token(0x0476), decval(1))] +
+        procedure_lines('FIRST', [line(1, label(0x0012, 'SECOND')), line(1, token(0x0476), decval(2))]) +
+        procedure_lines('SECOND', [line(1, token(0x0476), dblstr('two'))], flags=0x80)
+    ))
@@ -0,0 +1,118 @@
+import struct
+import pytest
+from AmosPy.adf import AdfImage, BadAdfImage, convert_image, main
+from AmosPy.converter import Converter
+from tests.amos_samples import sample_program, procedure_program
+
+__author__ = 'danny'
+
+
+def name_hash(name):
+    value = len(name)
+    for char in name.upper():
+        value = (value * 13 + ord(char)) & 0x7ff
+    return value % 72
+
+
+def adf_image(files, ffs=True):
+    """Build a DD disk image holding files, a dict of path -> contents"""
+    blocks = [bytearray(512) for _ in range(1760)]
+    blocks[0][:4] = b'DOS' + (b'\x01' if ffs else b'\x00')
+    root = 880
+    free = [882]
+
+    def allocate():
+        free[0] += 1
+        return free[0] - 1
+
+    def header(number, secondaryType, name, parent):
+        struct.pack_into('>LL', blocks[number], 0, 2, number)
+        struct.pack_into('B30s', blocks[number], 432, len(name), name.encode('latin-1'))
+        struct.pack_into('>LLl', blocks[number], 500, parent, 0, secondaryType)
+
+    def link(directory, number, name):
+        slot = 24 + 4 * name_hash(name)
+        struct.pack_into('>L', blocks[number], 496, struct.unpack_from('>L', blocks[directory], slot)[0])
+        struct.pack_into('>L', blocks[directory], slot, number)
+
+    header(root, 1, 'Disk', 0)
+    struct.pack_into('>L', blocks[root], 12, 72)
+    directories = {'': root}
+    dataSize = 512 if ffs else 488
+    for path in sorted(files):
+        parts = path.split('/')
+        for depth in range(1, len(parts)):
+            directory = '/'.join(parts[:depth])
+            if directory not in directories:
+                directories[directory] = allocate()
+                header(directories[directory], 2, parts[depth - 1], directories['/'.join(parts[:depth - 1])])
+                link(directories['/'.join(parts[:depth - 1])], directories[directory], parts[depth - 1])
+        parent = directories['/'.join(parts[:-1])]
+        data = files[path]
+        number = allocate()
+        header(number, -3, parts[-1], parent)
+        struct.pack_into('>L', blocks[number], 324, len(data))
+        link(parent, number, parts[-1])
+        chunks = [data[start:start + dataSize] for start in range(0, len(data), dataSize)]
+        dataBlocks = [allocate() for _ in chunks]
+        table = number
+        for index, (block, chunk) in enumerate(zip(dataBlocks, chunks)):
+            if index and index % 72 == 0:
+                extension = allocate()
+                struct.pack_into('>LL', blocks[extension], 0, 16, extension)
+                struct.pack_into('>l', blocks[extension], 508, -3)
+                struct.pack_into('>L', blocks[table], 504, extension)
+                table = extension
+            struct.pack_into('>L', blocks[table], 24 + 4 * (71 - index % 72), block)
+            struct.pack_into('>L', blocks[table], 8, index % 72 + 1)
+            if ffs:
+                blocks[block][:len(chunk)] = chunk
+            else:
+                nextBlock = dataBlocks[index + 1] if index + 1 < len(dataBlocks) else 0
+                struct.pack_into('>6L', blocks[block], 0, 8, number, index + 1, len(chunk), nextBlock, 0)
+                blocks[block][24:24 + len(chunk)] = chunk
+    return b''.join(bytes(block) for block in blocks)
+
+
+FILES = {'Prog.AMOS': sample_program(), 'Source/Procs': procedure_program(),
+         'Source/readme': b'Not a program', 'Big.AMOS': procedure_program() + b'\xaa' * 40000}
+
+
+@pytest.mark.parametrize('ffs', [True, False])
+def test_read_files(tmpdir, ffs):
+    image = tmpdir.join("disk.adf")
+    image.write_binary(adf_image(FILES, ffs))
+    with AdfImage(str(image)) as adf:
+        entries = dict((entry.path, entry) for entry in adf.entries())
+        assert sorted(entries) == sorted(FILES)
+        for path, contents in FILES.items():
+            assert adf.read(entries[path]) == contents
+        assert adf.open(entries['Prog.AMOS']).read(4) == b'AMOS'
+        assert sorted(entry.path for entry in adf.amos_files()) == ['Big.AMOS', 'Prog.AMOS', 'Source/Procs']
+
+
+def test_convert_image(tmpdir, capsys):
+    image = tmpdir.join("disk.adf")
+    image.write_binary(adf_image(FILES))
+    converted = dict((entry.path, list(lines)[1:]) for entry, converter, lines in convert_image(str(image)))
+    assert converted['Source/Procs'] == list(Converter().do_buffer(procedure_program()))[1:]
+    assert main([str(image), '-o', str(tmpdir.join("out"))]) == 0
+    assert tmpdir.join("out", "disk.adf", "Source", "Procs.txt").check()
+
+
+def test_directory_loops_and_bad_blocks(tmpdir):
+    data = bytearray(adf_image({'A/B/x.AMOS': sample_program(), 'y.AMOS': sample_program()}))
+    a, b = 882, 883
+    assert struct.unpack_from('>l', data, b * 512 + 508)[0] == 2
+    # B holds its parent A, and a root hash slot points past the end of the image
+    struct.pack_into('>L', data, b * 512 + 24 + 4 * ((name_hash('x.AMOS') + 1) % 72), a)
+    struct.pack_into('>L', data, 880 * 512 + 24 + 4 * ((name_hash('y.AMOS') + 1) % 72), 99999)
+    tmpdir.join("loop.adf").write_binary(bytes(data))
+    with AdfImage(str(tmpdir.join("loop.adf"))) as adf:
+        assert sorted(entry.path for entry in adf.entries()) == ['A/B/x.AMOS', 'y.AMOS']
+
+
+def test_not_an_image(tmpdir):
+    tmpdir.join("x.adf").write_binary(b'\x00' * 1024)
+    with pytest.raises(BadAdfImage):
+        AdfImage(str(tmpdir.join("x.adf")))
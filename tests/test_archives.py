@@ -0,0 +1,89 @@
+import io
+import sys
+import tarfile
+import zipfile
+import pytest
+from AmosPy.archives import BadArchive, archive_members, convert_archive, main, member_destination
+from AmosPy.converter import Converter
+from tests.amos_samples import sample_program, procedure_program, program, line, token, decval
+
+__author__ = 'danny'
+
+MEMBERS = [('disk1/Prog.AMOS', sample_program()), ('disk1/notes.txt', b'hello'),
+           ('disk2/Procs.amos', procedure_program())]
+
+
+def expected(data):
+    return list(Converter().do_buffer(data))
+
+
+def test_stream():
+    converter = Converter()
+    assert list(converter.do_file(io.BytesIO(procedure_program()))) == expected(procedure_program())
+    assert converter.bytes_read == len(procedure_program()) - 20
+
+
+def test_zip(tmpdir):
+    path = str(tmpdir.join("amos.zip"))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in MEMBERS:
+            archive.writestr(name, data)
+    converted = [(name, list(lines)) for name, converter, lines in convert_archive(path)]
+    assert converted == [('disk1/Prog.AMOS', expected(sample_program())),
+                         ('disk2/Procs.amos', expected(procedure_program()))]
+
+
+def test_tar(tmpdir):
+    path = str(tmpdir.join("amos.tar.gz"))
+    with tarfile.open(path, 'w:gz') as archive:
+        for name, data in MEMBERS:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    assert [name for name, stream in archive_members(path)] == ['disk1/Prog.AMOS', 'disk2/Procs.amos']
+    assert main([path, '-o', str(tmpdir.join("out"))]) == 0
+    text = tmpdir.join("out", "amos.tar.gz", "disk2", "Procs.amos.txt").read_binary().decode('latin-1')
+    assert text.splitlines() == expected(procedure_program())[1:]
+
+
+def test_failed_member_leaves_no_partial(tmpdir, capsys):
+    path = str(tmpdir.join("a.zip"))
+    with zipfile.ZipFile(path, 'w') as archive:
+        # A good line, then one claiming to be shorter than the tokens in it
+        archive.writestr('Bad.AMOS', program(line(0, token(0x0476), decval(1)), b'\x02\x00' + decval(1) + token(0)))
+        archive.writestr('Good.AMOS', sample_program())
+    out = tmpdir.join("out")
+    assert main([path, '-o', str(out)]) == 1
+    assert "a.zip:Bad.AMOS: FAILED" in capsys.readouterr()[0]
+    assert sorted(entry.basename for entry in out.join("a.zip").listdir()) == ['Good.AMOS.txt']
+
+
+def test_member_paths_stay_in_output(tmpdir, capsys):
+    path = str(tmpdir.join("evil.zip"))
+    escaped = str(tmpdir.join("abs.amos"))
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('../../escaped.amos', sample_program())
+        archive.writestr(escaped, sample_program())
+    out = tmpdir.join("out")
+    assert main([path, '-o', str(out)]) == 0
+    assert out.join("evil.zip", "escaped.amos.txt").check()
+    assert out.join("evil.zip", *escaped.lstrip('/').split('/')).dirpath().join("abs.amos.txt").check()
+    assert not tmpdir.join("escaped.amos.txt").check() and not tmpdir.join("abs.amos.txt").check()
+    assert not tmpdir.dirpath().dirpath().join("escaped.amos.txt").check()
+    with pytest.raises(BadArchive):
+        member_destination(str(out), path, '../..')
+    tmpdir.mkdir("elsewhere")
+    out.mkdir("linked")
+    out.join("linked").remove()
+    out.join("linked").mksymlinkto(tmpdir.join("elsewhere"))
+    with pytest.raises(BadArchive):
+        member_destination(str(out), "linked", 'prog.amos')
+
+
+def test_lha_needs_lhafile(tmpdir, monkeypatch):
+    path = str(tmpdir.join("amos.lha"))
+    tmpdir.join("amos.lha").write_binary(b'')
+    monkeypatch.setitem(sys.modules, 'lhafile', None)  # As if it weren't installed
+    with pytest.raises(BadArchive) as error:
+        list(archive_members(path))
+    assert 'needs the lhafile package' in str(error.value)
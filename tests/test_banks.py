@@ -0,0 +1,30 @@
+import struct
+from AmosPy.banks import list_banks, extract_banks
+from tests.amos_samples import program, line, token
+
+__author__ = 'danny'
+
+
+def bank_program():
+    data = struct.pack('>4sHHI8s', b'AmBk', 5, 1, 8 + 6, b'Datas   ') + b'abcdef'
+    sprite = struct.pack('>5H', 1, 2, 1, 0, 0) + b'\xff' * 4
+    sprites = struct.pack('>4sH', b'AmSp', 1) + sprite + b'\x00' * 64
+    return program(line(0, token(0x0476)), trailer=struct.pack('>4sH', b'AmBs', 2) + data + sprites)
+
+
+def test_list_banks():
+    banks = list_banks(bank_program())
+    assert [(bank.number, bank.name, bank.chip) for bank in banks] == [(5, 'Datas', False), (1, 'Sprites', True)]
+    assert banks[0].data_length == 6
+    assert banks[1].offset + banks[1].length == len(bank_program())
+    assert list_banks(program(line(0, token(0x0476)))) == []
+
+
+def test_extract_banks(tmpdir):
+    source = tmpdir.join("banks.AMOS")
+    source.write_binary(bank_program())
+    written = extract_banks(str(source), str(tmpdir.join("out")), data_only=True)
+    assert [path.split("/")[-1] for bank, path in written] == ["05_Datas.abk", "01_Sprites.abk"]
+    assert tmpdir.join("out", "05_Datas.abk").read_binary() == b'abcdef'
+    written = extract_banks(str(source), str(tmpdir.join("whole")))
+    assert tmpdir.join("whole", "01_Sprites.abk").read_binary().startswith(b'AmSp')
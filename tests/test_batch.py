@@ -0,0 +1,67 @@
+import os
+from AmosPy.batch import convert_batch, find_amos_files, main
+from AmosPy.converter import Converter
+from tests.amos_samples import sample_program, program, decval, token
+
+__author__ = 'danny'
+
+
+def make_tree(tmpdir):
+    tmpdir.mkdir("disk1").join("Good.AMOS").write_binary(sample_program())
+    # A line claiming to be shorter than the tokens in it
+    tmpdir.mkdir("disk2").join("bad.amos").write_binary(program(b'\x02\x00' + decval(1) + token(0)))
+    tmpdir.join("disk2", "notes.txt").write("not amos")
+
+
+def test_find_amos_files(tmpdir):
+    make_tree(tmpdir)
+    found = find_amos_files([str(tmpdir)])
+    assert [os.path.basename(source) for source, root in found] == ["Good.AMOS", "bad.amos"]
+
+
+def test_convert_batch(tmpdir):
+    make_tree(tmpdir)
+    output_dir = tmpdir.join("out")
+    for jobs in (1, 2):
+        results = list(convert_batch([str(tmpdir.join("disk*"))], jobs=jobs, output_dir=str(output_dir), force=True))
+        assert [result['error'] is None for result in results] == [True, False]
+        assert results[0]['unknown_tokens'] == 1
+        assert results[1]['error'].startswith('BadTokenRead')
+    assert " = 10 \n" in output_dir.join("Good.AMOS.txt").read()
+    assert not output_dir.join("bad.amos.txt").exists()
+    # Converted files are skipped on the next run, the failure is retried
+    results = list(convert_batch([str(tmpdir.join("disk*"))], jobs=1, output_dir=str(output_dir)))
+    assert [result.get('skipped', False) for result in results] == [True, False]
+
+
+def test_missing_and_unreadable_files(tmpdir, capsys):
+    missing = str(tmpdir.join("nonexist.AMOS"))
+    results = list(convert_batch([missing], jobs=1))
+    assert len(results) == 1 and results[0]['error'].startswith(('FileNotFoundError', 'IOError', 'OSError'))
+    tmpdir.mkdir("disk").join("Good.AMOS").write_binary(sample_program())
+    assert main([missing, str(tmpdir.join("disk")), '-j', '1']) == 1
+    out = capsys.readouterr()[0]
+    assert "nonexist.AMOS: FAILED " in out and "Good.AMOS: 100 of 100 code bytes read" in out
+    assert "2 files, 0 up to date, 1 failed" in out
+    assert main(['--verify', '-j', '1', missing]) == 1
+    assert "nonexist.AMOS: FAILED" in capsys.readouterr()[0]
+
+
+def test_unexpected_errors_fail_one_file(tmpdir, monkeypatch):
+    tmpdir.join("Good.AMOS").write_binary(sample_program())
+    tmpdir.join("Other.AMOS").write_binary(sample_program())
+    do_file = Converter.do_file
+
+    def failing(self, filename, mapped=False):
+        """Fails part way through writing Good.AMOS"""
+        for n, item in enumerate(do_file(self, filename, mapped)):
+            if n == 2 and filename.endswith('Good.AMOS'):
+                raise RuntimeError("maximum recursion depth exceeded")
+            yield item
+    monkeypatch.setattr(Converter, 'do_file', failing)
+    results = sorted(convert_batch([str(tmpdir)], jobs=1, output_dir=str(tmpdir.join("out"))),
+                     key=lambda result: result['source'])
+    assert len(results) == 2
+    assert results[0]['error'] == "RuntimeError: maximum recursion depth exceeded"
+    assert not os.path.exists(results[0]['destination'] + '.partial')
+    assert results[1]['error'] is None
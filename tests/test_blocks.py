@@ -0,0 +1,67 @@
+import struct
+from AmosPy.blocks import BlockIndex, main
+from tests.amos_samples import program, line, token, variable, procedure_program
+
+__author__ = 'danny'
+
+FOR, NEXT, IF, THEN, ELSE, ENDIF, EXIT, WEND, REPEAT, PRINT = (0x023c, 0x0246, 0x02be, 0x02c6, 0x02d0, 0x02da,
+                                                               0x029e, 0x0274, 0x0250, 0x0476)
+
+
+def words(tokenId, *values):
+    return token(tokenId, struct.pack('>%dH' % len(values), *values))
+
+
+def block_program():
+    return program(
+        line(1, words(FOR, 0x0030), variable('I')),
+        line(2, words(IF, 0x000a), variable('A')),
+        line(3, token(PRINT)),
+        line(2, words(ELSE, 0x0004)),
+        line(3, token(PRINT)),
+        line(2, token(ENDIF)),
+        line(2, words(EXIT, 1, 0x0008)),
+        line(1, token(NEXT)),
+        line(1, words(IF, 0), variable('A'), token(THEN), token(PRINT), words(ELSE, 0), token(PRINT)),
+        line(1, token(WEND)),
+        line(1, words(REPEAT, 0)),
+        line(1, token(PRINT)),
+    )
+
+
+def test_blocks():
+    data = block_program()
+    index = BlockIndex.from_buffer(data)
+    assert index.outline() == [(0, 'For', 0, 7), (1, 'If', 1, 5), (0, 'Repeat', 10, None)]
+    loop, branch, repeat = index.blocks
+    assert loop.words == (0x0030,) and branch.words == (0x000a,)
+    assert struct.unpack_from('>H', data, loop.end - 2)[0] == NEXT
+    assert index.match(loop.start) == loop.end - 2 and index.match(loop.end - 2) == loop.start
+    assert index.match(branch.elses[0]) == branch.end - 2
+    assert index.block_of(branch.elses[0]) is branch
+    assert [block.kind for block in index.enclosing(2)] == ['If', 'For']
+    assert index.jumps[0].kind == 'Exit' and index.jumps[0].words == (1, 0x0008) and index.jumps[0].block == 0
+    assert [message for offset, message in index.problems] == ["Wend without While", "Repeat is never closed"]
+    assert index.indent_problems() == []
+
+
+def test_procedures_and_indents():
+    index = BlockIndex.from_buffer(procedure_program())
+    assert index.outline() == [(0, 'Procedure', 2, 5), (0, 'Procedure', 6, 8)]
+    badIndent = program(line(1, words(FOR, 0), variable('I')), line(1, token(PRINT)), line(1, token(NEXT)))
+    assert BlockIndex.from_buffer(badIndent).indent_problems() == [1]
+
+
+def test_damaged_line():
+    """A negative payload length ends the line's walk instead of stepping backwards forever"""
+    data = program(line(1, words(FOR, 0), variable('I')), line(1, token(0x064a, struct.pack('bb', 0, -4))),
+                   line(1, token(NEXT)))
+    assert BlockIndex.from_buffer(data).outline() == [(0, 'For', 0, 2)]
+
+
+def test_main(tmpdir, capsys):
+    path = tmpdir.join("blocks.amos")
+    path.write_binary(block_program())
+    assert main([str(path)]) == 1
+    out = capsys.readouterr()[0]
+    assert "For: lines 1-8" in out and "  If: lines 2-6" in out and "Repeat is never closed" in out
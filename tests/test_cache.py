@@ -0,0 +1,51 @@
+from AmosPy.cache import ConversionCache, table_fingerprint
+from AmosPy.converter import Converter
+from AmosPy.token_table import token_map_entries
+from tests.amos_samples import sample_program
+
+__author__ = 'danny'
+
+
+def test_cache_hit(tmpdir, monkeypatch):
+    path = tmpdir.join("sample.AMOS")
+    path.write_binary(sample_program())
+    cache = ConversionCache(str(tmpdir.join("cache")))
+    lines, stats = cache.convert(str(path))
+    # A hit must not decode anything
+    monkeypatch.setattr(Converter, 'do_buffer', None)
+    assert cache.convert(str(path)) == (lines, stats)
+    assert stats['unknown_tokens'] == 1
+    assert stats['header']['version'] == b'AMOS Basic V134 '
+
+
+def test_fingerprint_follows_tables():
+    tokens = [(0x0476, 'Print', None), (0x003e, 'DecVal', len)]
+    fingerprint = table_fingerprint(tokens, {})
+    assert fingerprint == table_fingerprint(list(reversed(tokens)), {})
+    assert fingerprint != table_fingerprint([(0x0476, 'Print', None), (0x003e, 'DecVal', abs)], {})
+    assert fingerprint != table_fingerprint(tokens, {1: {0x0058: 'Music'}})
+
+
+def test_fingerprint_matches_token_map():
+    from AmosPy.amosTokens import token_map
+    assert table_fingerprint() == table_fingerprint(token_map_entries(token_map))
+
+
+def test_eviction(tmpdir):
+    cache = ConversionCache(str(tmpdir), max_bytes=1000)
+    stats = {'header': {'version': b'AMOS', 'length': 0}, 'bytes_read': 0, 'unknown_tokens': 0}
+    for n in range(10):
+        cache.put(cache.key(b'%d' % n), ['x' * 200], stats)
+    assert sum(size for mtime, size, path in cache.entries()) <= 1000
+    assert cache.get(cache.key(b'9')) is not None
+
+
+def test_puts_keep_a_running_size(tmpdir, monkeypatch):
+    cache = ConversionCache(str(tmpdir), max_bytes=100000)
+    stats = {'header': {'version': b'AMOS', 'length': 0}, 'bytes_read': 0, 'unknown_tokens': 0}
+    scans = []
+    monkeypatch.setattr(cache, 'evict', lambda evict=cache.evict: scans.append(1) or evict())
+    for n in range(20):
+        cache.put(cache.key(b'%d' % n), ['x' * 200], stats)
+    assert len(scans) == 1
+    assert cache.total == sum(size for mtime, size, path in cache.entries())
@@ -0,0 +1,60 @@
+import struct
+from AmosPy.call_graph import CallGraph, CallGraphCache, MAIN, main
+from tests.amos_samples import program, line, token, label, procedure_lines
+
+__author__ = 'danny'
+
+
+def call(name):
+    return label(0x0012, name)
+
+
+def library_program(extra=()):
+    """Main calls MAIN1, which calls HELPER twice and a missing procedure. UNUSED calls HELPER too"""
+    return program(*(
+        [line(0, call('MAIN1'))] +
+        procedure_lines('MAIN1', [line(1, call('HELPER')), line(1, call('MISSING')), line(1, call('helper'))]) +
+        procedure_lines('HELPER', [line(1, token(0x0476))] + list(extra)) +
+        procedure_lines('UNUSED', [line(1, call('HELPER'))])
+    ))
+
+
+def test_graph():
+    graph, spans = CallGraph.from_buffer(library_program())
+    assert graph.procedures == ['MAIN1', 'HELPER', 'UNUSED']
+    assert graph.calls[MAIN] == ['MAIN1'] and graph.calls['MAIN1'] == ['HELPER']
+    assert graph.unresolved == {'MAIN1': ['MISSING']}
+    assert graph.reachable() == set([MAIN, 'MAIN1', 'HELPER'])
+    assert graph.dead() == ['UNUSED']
+    assert graph.dependencies('MAIN1') == ['HELPER'] and graph.dependencies('HELPER') == []
+    assert graph.callers('HELPER') == ['MAIN1', 'UNUSED']
+    assert len(spans) == 4
+
+
+def test_damaged_line():
+    data = program(line(0, call('FIRST'), token(0x0026, struct.pack('>h', -6)), call('LOST')), line(0, call('NEXT')))
+    assert CallGraph.from_buffer(data)[0].unresolved == {MAIN: ['FIRST', 'NEXT']}
+
+
+def test_cache_rewalks_changed_spans(tmpdir):
+    path = tmpdir.join("library.amos")
+    path.write_binary(library_program())
+    cache = CallGraphCache(str(tmpdir.join("cache")))
+    cache.graph(str(path))
+    assert cache.scanned == 4
+    assert cache.graph(str(path)).dead() == ['UNUSED']
+    assert cache.scanned == 0
+    path.write_binary(library_program([line(1, call('UNUSED'))]))
+    graph = cache.graph(str(path))
+    assert cache.scanned == 1
+    assert graph.dead() == [] and graph.dependencies('MAIN1') == ['HELPER', 'UNUSED']
+
+
+def test_main(tmpdir, capsys):
+    path = tmpdir.join("library.amos")
+    path.write_binary(library_program())
+    assert main([str(path)]) == 0
+    out = capsys.readouterr()[0]
+    assert "UNUSED: never called" in out and "MAIN1: calls missing MISSING" in out
+    assert main([str(path), 'main1']) == 0
+    assert capsys.readouterr()[0].split() == ['HELPER']
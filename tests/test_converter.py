@@ -0,0 +1,64 @@
+import struct
+import pytest
+from AmosPy import converter as converter_module
+from AmosPy.converter import Converter, Renderer, renderLine, tokenToStr
+from AmosPy.token_reader import BadTokenRead
+from tests.amos_samples import program, line, token, decval
+
+__author__ = 'danny'
+
+GOOD = line(0, token(0x0476), decval(1))
+# Claims to be 2 words long, but the DecVal in it takes 3
+BAD = b'\x02\x00' + decval(1) + token(0)
+
+
+def test_strict_conversion_fails():
+    with pytest.raises(BadTokenRead):
+        list(Converter().do_buffer(program(GOOD, BAD, GOOD)))
+
+
+def test_tolerant_conversion():
+    data = program(GOOD, BAD, GOOD)
+    converter = Converter(tolerant=True)
+    lines = list(converter.do_buffer(data))[1:]
+    assert lines[0] == lines[-1] == "Print 1 "
+    assert lines[1] == "[Bad line at offset 0x%x: BadTokenRead]" % (20 + len(GOOD))
+    assert converter.bytes_read == len(data) - 20
+    assert [error['offset'] for error in converter.errors] == [20 + len(GOOD)]
+
+
+def test_tolerant_truncated():
+    data = program(GOOD, GOOD)[:-3]
+    converter = Converter(tolerant=True)
+    lines = list(converter.do_buffer(data))[1:]
+    assert lines == ["Print 1 ", "[Bad line at offset 0x%x: struct.error]" % (20 + len(GOOD))]
+    assert len(converter.errors) == 1
+
+
+def test_negative_binval():
+    data = program(line(0, token(0x0476), token(0x001e, struct.pack('>i', -1))), GOOD)
+    assert list(Converter().do_buffer(data))[1:] == ["Print %" + '1' * 32 + " ", "Print 1 "]
+
+
+def test_tolerant_render_failure(monkeypatch):
+    def render(indentLevel, tokensRead):
+        if tokensRead[1][1] == 2:
+            raise ValueError("can't render")
+        return renderLine(indentLevel, tokensRead)
+    monkeypatch.setattr(converter_module, 'renderLine', render)
+    bad = line(0, token(0x0476), decval(2))
+    converter = Converter(tolerant=True)
+    lines = list(converter.do_buffer(program(GOOD, bad, GOOD)))[1:]
+    assert lines == ["Print 1 ", "[Bad line at offset 0x%x: ValueError]" % (20 + len(GOOD)), "Print 1 "]
+    assert converter.errors == [{'offset': 20 + len(GOOD), 'error_offset': 20 + len(GOOD), 'length': len(bad),
+                                 'error': "ValueError: can't render"}]
+
+
+def test_renderer_matches_tokenToStr():
+    tokens = [('Variable', 'A'), ('DecVal', -3), ('HexVal', 255), ('BinVal', 5), ('Dbl Str', 'Hi'),
+              ('Label', 'L'), ('Extension', (1, 0x0058)), ('Extension', (9, 0x0010)),
+              ('Procedure', {'flags': set(['folded'])}), ('Float', 1.5), ('Rem', 'note'),
+              ('Print', None), ('[Unknown token 0x1234]', None), (None, None)]
+    expected = '  ' + ' '.join(tokenToStr(*token) for token in tokens)
+    assert Renderer().renderLine(2, tokens) == expected
+    assert renderLine(2, tokens) == expected
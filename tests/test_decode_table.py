@@ -0,0 +1,22 @@
+from AmosPy.amosTokens import token_map
+from AmosPy.decode_table import buffer_table, stream_table, UNKNOWN, TABLE_SIZE
+
+__author__ = 'danny'
+
+
+def test_tables_cover_token_map():
+    """Every token in the map should be in both tables, everything else unknown"""
+    for table in (stream_table(), buffer_table()):
+        assert len(table) == TABLE_SIZE
+        known = [token for token in range(TABLE_SIZE) if table[token] is not UNKNOWN]
+        assert sorted(known) == sorted(token_map)
+
+
+def test_payload_sizes():
+    """Fixed size payloads have a precompiled struct, variable ones don't"""
+    assert buffer_table()[0x0476] == ('Print', None, 0, None)
+    assert buffer_table()[0x003e].size == 4
+    assert buffer_table()[0x004e].struct.size == 4
+    assert buffer_table()[0x023c].size == 2
+    assert buffer_table()[0x0026].size is None
+    assert buffer_table()[0x0000].name is None
@@ -0,0 +1,81 @@
+import os
+import struct
+import pytest
+from AmosPy import decrypt
+from AmosPy.converter import Converter
+from AmosPy.decrypt import crypt_procedure, decrypt_procedures, key_stream
+from AmosPy.procedures import list_procedures
+from tests.amos_samples import procedure_program
+
+__author__ = 'danny'
+
+
+def seeded_program(seed=0x1234, seed2=0x56):
+    """procedure_program with seeds in its SECOND procedure"""
+    data = bytearray(procedure_program())
+    second = list_procedures(data)[1]
+    struct.pack_into('>h', data, second.start + 8, seed)
+    struct.pack_into('B', data, second.start + 11, seed2)
+    return bytes(data)
+
+
+def encrypted_program(seed=0x1234, seed2=0x56):
+    data = bytearray(seeded_program(seed, seed2))
+    crypt_procedure(data, list_procedures(data)[1])
+    return bytes(data)
+
+
+def test_key_stream():
+    procedure = list_procedures(procedure_program())[1]
+    procedure.data.update(bytesToEnd=0x10, encSeed=(3, 0x01))
+    # 0x1001, then (0x1001 + 1) >> 1, then (0x801 + 4) rotated right with its low bit going to the top
+    assert list(key_stream(procedure, 3)) == [0x1001, 0x0801, 0x0402]
+
+
+def test_encrypted_flag():
+    data = encrypted_program()
+    plain = seeded_program()
+    first, second = list_procedures(data)
+    assert second.flags == set(['folded', 'encrypted'])
+    assert data[:second.start + 8] == plain[:second.start + 8]
+    assert data[second.start + 16:] != plain[second.start + 16:]
+
+
+def test_decrypt_procedures():
+    plain = procedure_program()
+    assert decrypt_procedures(plain) is plain
+    assert bytes(decrypt_procedures(encrypted_program())) == seeded_program()
+
+
+def import_numpy():
+    """numpy, skipping the test where it isn't installed, except on CI, which installs it"""
+    if os.environ.get('CI'):
+        import numpy
+        return numpy
+    return pytest.importorskip('numpy')
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def xor_path(request, monkeypatch):
+    """Run a test with numpy doing the xor, and again with the plain loop"""
+    if request.param == 'numpy':
+        monkeypatch.setattr(decrypt, 'numpy', import_numpy())
+    else:
+        monkeypatch.setattr(decrypt, 'numpy', None)
+    return request.param
+
+
+def test_converter_decrypt(xor_path):
+    expected = list(Converter().do_buffer(procedure_program()))
+    assert list(Converter(decrypt=True).do_buffer(encrypted_program())) == expected
+    data = encrypted_program(seed=-2, seed2=0xff)
+    assert list(Converter(decrypt=True).do_buffer(data)) == expected
+
+
+def test_numpy_matches_loop(monkeypatch):
+    numpy = import_numpy()
+    seeds = [(0x1234, 0x56), (-2, 0xff), (0, 0), (0x7fff, 0x80)]
+    monkeypatch.setattr(decrypt, 'numpy', None)
+    expected = [encrypted_program(seed, seed2) for seed, seed2 in seeds]
+    monkeypatch.setattr(decrypt, 'numpy', numpy)
+    assert [encrypted_program(seed, seed2) for seed, seed2 in seeds] == expected
@@ -0,0 +1,64 @@
+import struct
+import pytest
+from AmosPy.converter import Converter
+from AmosPy.encoder import BadTokenWrite, Encoder, encode, encode_file
+from tests.amos_samples import (sample_program, procedure_program, program, line, token, extension, decval,
+                                label, variable)
+
+__author__ = 'danny'
+
+
+def convert(data):
+    return list(Converter().do_buffer(data))[1:]
+
+
+def test_round_trip():
+    """Encoding the text of the samples gives back the same code"""
+    for data in (sample_program(), procedure_program()):
+        encoded = encode(convert(data))
+        assert encoded[:len(data)] == data
+        assert encoded[len(data):] == b'AmBs\x00\x00'
+
+
+def test_longest_match():
+    data = program(line(0, extension(1, 0x002c), token(0x005c), extension(1, 0x0058), decval(2)),
+                   line(2, token(0x0168), token(0x0316, b'\x00' * 4)))
+    lines = convert(data)
+    assert lines == ["Music Stop , Music 2 ", "  On Menu Del On "]
+    assert encode(lines)[:len(data)] == data
+
+
+def test_value_round_trip():
+    values = [token(0x001e, struct.pack('>i', 5)), token(0x0036, struct.pack('>i', -1)),
+              token(0x001e, struct.pack('>i', -2)), token(0x0036, struct.pack('>i', 255)), decval(-3)]
+    data = program(line(0, token(0x0476), *values))
+    lines = convert(data)
+    assert lines == ["Print %101 0xffffffff %11111111111111111111111111111110 0xff -3 "]
+    assert encode(lines)[:len(data)] == data
+    with pytest.raises(BadTokenWrite):
+        Encoder().encode_line("Print 0x100000000 ")
+
+
+def test_label_ref_round_trip():
+    data = program(line(0, token(0x02a8), label(0x0018, 'LOOP')),
+                   line(0, token(0x0316, b'\x00' * 4), variable('A'), token(0x02b2), label(0x0018, 'ONE'),
+                        token(0x005c), label(0x0018, 'TWO')),
+                   line(0, token(0x0476), variable('LOOP')))
+    lines = convert(data)
+    assert lines == ["Goto LOOP ", "On A Gosub ONE , TWO ", "Print LOOP "]
+    assert encode(lines)[:len(data)] == data
+
+
+def test_file_round_trip(tmpdir):
+    source = tmpdir.join("prog.txt")
+    source.write_binary(b'\n'.join(line.encode('latin-1') for line in convert(procedure_program())) + b'\n')
+    encode_file(str(source), str(tmpdir.join("prog.AMOS")))
+    converter = Converter()
+    lines = list(converter.do_file(str(tmpdir.join("prog.AMOS"))))[1:]
+    assert lines == convert(procedure_program())
+    assert converter.unknown_tokens == 0
+
+
+def test_bad_text():
+    with pytest.raises(BadTokenWrite):
+        Encoder().encode_line("Print {oops} ")
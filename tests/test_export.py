@@ -0,0 +1,59 @@
+import io
+import json
+import struct
+from AmosPy.converter import Converter
+from AmosPy.export import Exporter, ndjson_lines
+from AmosPy.output import write_lines
+from tests.amos_samples import sample_program, procedure_program, line, program, token
+
+__author__ = 'danny'
+
+
+def export(data):
+    exporter = Exporter()
+    sink = io.BytesIO()
+    write_lines(ndjson_lines(exporter.records(data)), sink, 'ascii')
+    return exporter, [json.loads(line) for line in sink.getvalue().decode('ascii').splitlines()]
+
+
+def test_records():
+    exporter, records = export(sample_program())
+    assert records[0] == {'version': 'AMOS Basic V134', 'length': len(sample_program()) - 20}
+    first = records[1]
+    assert first['line'] == 0 and first['indent'] == 1 and first['offset'] == 20
+    assert [token['id'] for token in first['tokens']] == [0x0006, 0xffa2, 0x003e, 0x0000]
+    assert first['tokens'][0]['data'] == 'A' and first['tokens'][2]['data'] == 10
+    assert first['tokens'][0]['offset'] == 22
+    assert records[2]['tokens'][1]['data'] == 'Hello'
+    assert records[3]['tokens'][0] == {'id': 0x064a, 'name': 'Rem', 'offset': records[3]['offset'] + 2,
+                                       'data': 'a comment'}
+    assert records[4]['tokens'][0]['data']['extension'] == 1
+    assert records[6]['tokens'][1]['name'] == '[Unknown token 0x1234]'
+
+
+def test_counts_match_converter():
+    for data in (sample_program(), procedure_program()):
+        converter = Converter()
+        lines = list(converter.do_buffer(data))[1:]
+        exporter, records = export(data)
+        assert len(records) - 1 == len(lines)
+        assert (exporter.bytes_read, exporter.unknown_tokens) == (converter.bytes_read, converter.unknown_tokens)
+    declaration = export(procedure_program())[1][3]['tokens'][0]
+    assert declaration['data']['flags'] == [] and declaration['data']['encSeed'] == [0, 0]
+
+
+def test_non_finite_floats():
+    values = (float('nan'), float('inf'), -float('inf'), 1.5)
+    floats = [token(0x0046, struct.pack('>f', value)) for value in values]
+    data = program(line(0, *floats))
+    values = [record['data'] for record in export(data)[1][1]['tokens'][:4]]
+    assert values == ['nan', 'inf', '-inf', 1.5]
+
+
+def test_reuse():
+    exporter = Exporter()
+    for data in (sample_program(), procedure_program(), sample_program()):
+        converter = Converter()
+        lines = list(converter.do_buffer(data))
+        assert len(list(exporter.records(data))) == len(lines)
+        assert (exporter.bytes_read, exporter.unknown_tokens) == (converter.bytes_read, converter.unknown_tokens)
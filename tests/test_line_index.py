@@ -0,0 +1,46 @@
+import os
+import struct
+import pytest
+from AmosPy.converter import Converter
+from AmosPy.line_index import LineIndex
+from tests.amos_samples import sample_program, procedure_program
+
+__author__ = 'danny'
+
+
+def test_decode_lines_match_converter():
+    data = sample_program()
+    lines = list(Converter().do_buffer(data))[1:]
+    index = LineIndex.build(data)
+    assert len(index) == len(lines)
+    assert index.decode_line(data, 3) == lines[3]
+    assert index.decode_line(data, -1) == lines[-1]
+    assert list(index.decode_lines(data, 2, 5)) == lines[2:5]
+    assert list(index.decode_lines(data, 4)) == lines[4:]
+
+
+def test_cached_index(tmpdir):
+    data = sample_program()
+    source = tmpdir.join("sample.AMOS")
+    source.write_binary(data)
+    index_file = str(tmpdir.join("sample.lines"))
+    built = LineIndex.cached(data, str(source), index_file)
+    loaded = LineIndex.cached(data, str(source), index_file)
+    assert loaded.offsets == built.offsets
+    assert loaded.span(0) == (20, built.offsets[1])
+    with open(index_file, 'rb') as fd:
+        assert fd.read()[-4:] == struct.pack('<I', built.offsets[-1])  # Little endian on any host
+
+
+def test_cached_index_of_replaced_file(tmpdir):
+    source = tmpdir.join("sample.AMOS")
+    source.write_binary(sample_program())
+    index_file = str(tmpdir.join("sample.lines"))
+    LineIndex.cached(sample_program(), str(source), index_file)
+    # Replaced by another program with an older mtime, as cp -p or unpacking an archive can
+    data = procedure_program()
+    source.write_binary(data)
+    os.utime(str(source), (1, 1))
+    assert LineIndex.cached(data, str(source), index_file).offsets == LineIndex.build(data).offsets
+    with pytest.raises(ValueError):
+        LineIndex.load(index_file, sample_program())
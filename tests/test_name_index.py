@@ -0,0 +1,71 @@
+import struct
+import os
+from AmosPy.name_index import NameIndex, identifiers, main
+from tests.amos_samples import program, line, token, label, variable, decval, procedure_program, sample_program
+
+__author__ = 'danny'
+
+
+def test_identifiers():
+    names = list(identifiers(procedure_program()))
+    assert (0, 'Call', 'FIRST') in names
+    assert (2, 'Procedure', 'FIRST') in names and (6, 'Procedure', 'SECOND') in names
+    assert (3, 'Call', 'SECOND') in names
+    assert (4, 'Variable', 'A') in list(identifiers(sample_program()))
+
+
+def test_damaged_line():
+    """A negative payload length ends that line's names, rather than walking backwards forever"""
+    data = program(line(0, variable('A'), token(0x064a, struct.pack('bb', 0, -4)), variable('B')),
+                   line(0, variable('C')))
+    assert [name for lineNo, kind, name in identifiers(data)] == ['A', 'C']
+
+
+def test_incremental_update(tmpdir):
+    corpus = tmpdir.mkdir("corpus")
+    corpus.join("main.amos").write_binary(procedure_program())
+    corpus.join("other.amos").write_binary(program(line(0, label(0x0018, 'LOOP')),
+                                                   line(0, label(0x0012, 'second'))))
+    index = NameIndex(str(tmpdir.join("names.db")))
+    assert index.update([str(corpus)]) == {'added': 2, 'updated': 0, 'unchanged': 0, 'removed': 0,
+                                           'failed': 0}
+    assert index.files_with('SECOND', 'Call') == sorted([str(corpus.join("main.amos")),
+                                                         str(corpus.join("other.amos"))])
+    assert index.find('first', 'Procedure') == [(str(corpus.join("main.amos")), 2, 'Procedure')]
+
+    assert index.update([str(corpus)])['unchanged'] == 2
+    other = corpus.join("other.amos")
+    other.write_binary(program(line(0, variable('X'), token(0xffa2), decval(1))))
+    os.utime(str(other), (1, 1))
+    corpus.join("main.amos").remove()
+    assert index.update([str(corpus)]) == {'added': 0, 'updated': 1, 'unchanged': 0, 'removed': 1,
+                                           'failed': 0}
+    assert index.files_with('SECOND') == []
+    assert index.find('X') == [(str(other), 0, 'Variable')]
+    index.close()
+
+
+def test_unreadable_files(tmpdir, monkeypatch):
+    corpus = tmpdir.mkdir("corpus")
+    corpus.join("main.amos").write_binary(procedure_program())
+    corpus.join("gone.amos").write_binary(procedure_program())
+    index = NameIndex(str(tmpdir.join("names.db")))
+    stat = os.stat
+
+    def vanishing(path):
+        if path.endswith('gone.amos'):
+            raise OSError(2, "No such file or directory", path)
+        return stat(path)
+    monkeypatch.setattr(os, 'stat', vanishing)
+    counts = index.update([str(corpus)])
+    assert counts['added'] == 1 and counts['failed'] == 1
+    assert index.files_with('SECOND', 'Call') == [str(corpus.join("main.amos"))]
+    index.close()
+
+
+def test_cli(tmpdir, capsys):
+    tmpdir.join("main.amos").write_binary(procedure_program())
+    db = str(tmpdir.join("names.db"))
+    assert main([db, 'update', str(tmpdir)]) == 0
+    assert main([db, 'find', 'SECOND', '-k', 'Call']) == 0
+    assert capsys.readouterr()[0].splitlines()[-1] == "%s:4: Call" % tmpdir.join("main.amos")
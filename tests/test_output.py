@@ -0,0 +1,40 @@
+import gzip
+import io
+from AmosPy.output import LineWriter, open_output, write_lines
+
+__author__ = 'danny'
+
+
+def test_write_lines_in_chunks():
+    class Sink(io.BytesIO):
+        writes = 0
+        flushes = 0
+
+        def write(self, data):
+            Sink.writes += 1
+            return io.BytesIO.write(self, data)
+
+        def flush(self):
+            Sink.flushes += 1
+    sink = Sink()
+    lines = ("line %d" % n for n in range(1000))
+    assert write_lines(lines, sink, buffer_size=4096) == 1000
+    assert sink.getvalue().decode('latin-1').splitlines()[-1] == "line 999"
+    assert 1 < Sink.writes < 10
+    assert Sink.flushes == 1
+
+
+def test_text_sink():
+    sink = io.StringIO()
+    assert write_lines([u"Print \"caf\xe9\"", u"Rem x"], sink, buffer_size=4) == 2
+    assert sink.getvalue() == u"Print \"caf\xe9\"\nRem x\n"
+
+
+def test_compressed_output(tmpdir):
+    path = str(tmpdir.join("out.txt.gz"))
+    with open_output(path) as sink:
+        writer = LineWriter(sink)
+        writer.write(u"Print \"caf\xe9\"")
+        writer.flush()
+    with gzip.open(path) as fd:
+        assert fd.read() == b'Print "caf\xe9"\n'
@@ -0,0 +1,67 @@
+import struct
+from AmosPy.converter import Converter
+from AmosPy.parallel import ParallelConverter, chunk_bounds
+from tests.amos_samples import program, line, token, variable, decval, dblstr
+
+__author__ = 'danny'
+
+
+def decode(converter, filename):
+    """The lines a converter gives, and the error it stopped with"""
+    lines, error = [], None
+    try:
+        for item in converter.do_file(filename):
+            lines.append(item)
+    except Exception as e:
+        error = type(e)
+    return lines, error, converter.bytes_read, converter.unknown_tokens
+
+
+def check(tmpdir, data, chunk_bytes=64):
+    path = tmpdir.join("big.amos")
+    path.write_binary(data)
+    expected = decode(Converter(), str(path))
+    assert decode(ParallelConverter(jobs=2, chunk_bytes=chunk_bytes), str(path)) == expected
+    return expected
+
+
+def test_matches_converter(tmpdir):
+    lines = [line(n % 4, variable('A'), token(0xffa2), decval(n), token(0x1234), dblstr('x' * (n % 7)))
+             for n in range(200)]
+    result = check(tmpdir, program(*lines))
+    assert len(result[0]) == 201 and result[3] == 200
+
+
+def test_bad_line(tmpdir):
+    lines = [line(0, decval(n)) for n in range(100)]
+    lines[60] = b'\x02\x00' + decval(1) + token(0)
+    lines, error, bytesRead, unknown = check(tmpdir, program(*lines))
+    assert error is not None and len(lines) == 61
+
+
+def test_chain_mismatch(tmpdir):
+    """A line whose length byte is longer than its tokens leaves decoding out of step
+    with the line chain, so the chunks after it start in the wrong place"""
+    lines = [line(0, decval(n)) for n in range(100)]
+    lines[30] = struct.pack('BB', 6, 0) + decval(1) + token(0) + b'\x02\x00'
+    lines, error, bytesRead, unknown = check(tmpdir, program(*lines), chunk_bytes=1)
+    assert error is None and unknown == 1
+
+
+def test_chunk_error(tmpdir):
+    lines = [line(0, decval(n)) for n in range(100)]
+    lines[30] = struct.pack('BB', 6, 0) + decval(1) + token(0) + b'\x03\x00'
+    lines, error, bytesRead, unknown = check(tmpdir, program(*lines), chunk_bytes=1)
+    assert error is not None
+
+
+def test_truncated(tmpdir):
+    """Lines up to the truncation come back, as they do from Converter, before the error"""
+    data = program(*[line(0, decval(n)) for n in range(100)])[:-50]
+    lines, error, bytesRead, unknown = check(tmpdir, data)
+    assert error is not None and len(lines) == 96 and bytesRead == 950
+
+
+def test_chunk_bounds():
+    assert chunk_bounds([20, 30, 40, 50], 60, 20) == [(20, 40), (40, 60)]
+    assert chunk_bounds([], 20, 20) == []
@@ -0,0 +1,30 @@
+import struct
+from AmosPy.batch import main
+from AmosPy.probe import probe, probe_all
+from tests.amos_samples import program, sample_program
+
+__author__ = 'danny'
+
+
+def test_probe(tmpdir):
+    tmpdir.join("a.amos").write_binary(sample_program())
+    tmpdir.join("pro.amos").write_binary(program(version=b'AMOS Pro101V\x00\x00\x00\x00',
+                                                 trailer=struct.pack('>4sH', b'AmBs', 3)))
+    tmpdir.join("short.amos").write_binary(sample_program()[:30])
+    tmpdir.join("exe.amos").write_binary(b'\x00\x00\x03\xf3' + b'\x00' * 40)
+    tmpdir.join("text.amos").write_binary(b'Print "hi"')
+    infos = dict((info.filename[len(str(tmpdir)) + 1:], info)
+                 for info in probe_all([str(path) for path in tmpdir.listdir()]))
+    assert infos['a.amos'][1:5] == ('AMOS 1.3', 'AMOS Basic V134', len(sample_program()) - 20, None)
+    assert infos['pro.amos'][1:5] == ('AMOS Pro', 'AMOS Pro101V', 0, 3)
+    assert infos['short.amos'].error == 'truncated'
+    assert infos['exe.amos'].kind == 'compiled'
+    assert infos['text.amos'].kind == 'not-AMOS'
+    assert probe(str(tmpdir.join("missing.amos"))).error
+
+
+def test_probe_cli(tmpdir, capsys):
+    tmpdir.join("a.amos").write_binary(sample_program())
+    assert main(['--probe', str(tmpdir)]) == 0
+    out = capsys.readouterr()[0]
+    assert 'AMOS Basic V134' in out and out.splitlines()[-1] == '1 AMOS 1.3'
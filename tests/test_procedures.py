@@ -0,0 +1,22 @@
+from AmosPy.converter import Converter
+from AmosPy.procedures import list_procedures, decode_procedure, extract_procedures
+from tests.amos_samples import procedure_program
+
+__author__ = 'danny'
+
+
+def test_list_procedures():
+    data = procedure_program()
+    procedures = list_procedures(data)
+    assert [(procedure.name, procedure.flags) for procedure in procedures] == [('FIRST', set()),
+                                                                              ('SECOND', set(['folded']))]
+    assert procedures[0].end == procedures[1].start
+    assert procedures[1].end == len(data)
+
+
+def test_decode_procedure():
+    data = procedure_program()
+    lines = list(Converter().do_buffer(data))[1:]
+    first, second = list_procedures(data)
+    assert list(decode_procedure(data, first)) == lines[2:6]
+    assert [procedure.name for procedure, procLines in extract_procedures(data, ['SECOND'])] == ['SECOND']
@@ -0,0 +1,43 @@
+import json
+from AmosPy.converter import Converter, renderLine
+from AmosPy.profiling import Profiler
+from tests.amos_samples import sample_program
+
+__author__ = 'danny'
+
+
+def test_profiled_conversion(tmpdir):
+    data = sample_program()
+    path = tmpdir.join("sample.AMOS")
+    path.write_binary(data)
+    plain = list(Converter().do_buffer(data))
+    for mapped in (False, True):
+        profiler = Profiler()
+        converter = Converter(profiler)
+        assert list(converter.do_file(str(path), mapped)) == plain
+        assert converter.unknown_tokens == 1
+        profile = json.loads(json.dumps(profiler.as_dict()))
+        counts = dict((token['name'], token['count']) for token in profile['tokens'])
+        assert counts['Print'] == 3
+        assert counts['Variable'] == 2
+        assert profile['handlers']['readValFrom' if mapped else 'readVal']['calls'] == 3
+        assert profile['formatters']['DecVal']['calls'] == 3
+        assert profile['files'][0]['lines'] == len(plain) - 1
+
+
+def test_merge():
+    profiler = Profiler()
+    list(Converter(profiler).do_buffer(sample_program()))
+    total = Profiler()
+    total.merge(profiler.as_dict())
+    total.merge(profiler.as_dict())
+    assert total.token_counts[0x0476] == 6
+    assert len(total.files) == 2
+
+
+def test_render_line_uses_renderer():
+    profiler = Profiler()
+    tokens = [('Print', None), ('DecVal', 12), ('Mystery', 'x'), (None, None)]
+    assert profiler.renderLine(2, tokens) == renderLine(2, tokens)
+    assert 'Mystery' in profiler.renderer.formats
+    assert profiler.formatter_calls['Mystery'] == 1
@@ -1,4 +1,4 @@
-from AmosPy.read_parse_toktab import process_similar, capitalize_all
+from AmosPy.read_parse_toktab import process_similar, capitalize_all, verify_token_table
 
 
 def test_process_similar():
@@ -29,4 +29,8 @@ def test_capitalize_all():
 #     476+4 TkPr:	dc.w CPrnt-Tk,Synt-Tk
 #         +8 	dc.b "prin","t"+$80,"I",-1
 #     """.splitlines()
-#
\ No newline at end of file
+#
+
+def test_token_table_is_current():
+    """amosTokens.tab should be regenerated (read_parse_toktab.py --table) whenever amosTokens.py changes"""
+    assert verify_token_table()
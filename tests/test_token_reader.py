@@ -0,0 +1,47 @@
+from AmosPy.converter import Converter
+from AmosPy.payloads import TextView, toText
+from AmosPy.token_reader import BufferTokenReader
+from tests.amos_samples import sample_program
+
+__author__ = 'danny'
+
+
+def convert(do_method, data):
+    converter = Converter()
+    items = do_method(converter, data)
+    header = next(items)
+    lines = list(items)
+    return header, lines, converter.bytes_read, converter.unknown_tokens
+
+
+def test_buffer_matches_stream(tmpdir):
+    data = sample_program()
+    path = tmpdir.join("sample.AMOS")
+    path.write_binary(data)
+    from_stream = convert(Converter.do_file, str(path))
+    from_buffer = convert(Converter.do_buffer, data)
+    from_mmap = convert(lambda c, name: c.do_file(name, mapped=True), str(path))
+    from_view = convert(Converter.do_buffer, memoryview(data))
+    assert from_stream == from_buffer == from_mmap == from_view
+
+
+def test_buffer_output():
+    header, lines, bytes_read, unknown_tokens = convert(Converter.do_buffer, sample_program())
+    assert header['length'] == bytes_read
+    assert unknown_tokens == 1
+    assert lines[0].endswith(" = 10 ")
+    assert lines[2] == " Rem %r " % b"a comment"
+    assert lines[3] == " Music 1 "
+    assert lines[5] == " Print [Unknown token 0x1234] "
+
+
+def test_text_payloads_are_views():
+    """Buffer strings and remarks stay in the buffer until used, but act like bytes"""
+    data = bytearray(sample_program())
+    tr = BufferTokenReader(data, 20)
+    tr.readTokenisedLine()
+    string = tr.readTokenisedLine()[2][1][1]
+    assert isinstance(string, TextView)
+    assert string == b'Hello' and hash(string) == hash(b'Hello') and repr(string) == repr(b'Hello')
+    data[string.offset] = ord('J')
+    assert string.tobytes() == b'Jello' and toText(string) == 'Jello'
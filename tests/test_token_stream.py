@@ -0,0 +1,24 @@
+from AmosPy.converter import Converter
+from AmosPy.token_stream import TokenStream
+from tests.amos_samples import sample_program, procedure_program
+
+__author__ = 'danny'
+
+
+def test_render_matches_converter():
+    for data in (sample_program(), procedure_program()):
+        converter = Converter()
+        lines = list(converter.do_buffer(data))[1:]
+        stream = TokenStream.from_buffer(data)
+        assert list(stream.render()) == lines
+        assert stream.bytes_read == converter.bytes_read
+        assert stream.unknown_tokens == converter.unknown_tokens
+
+
+def test_columns():
+    stream = TokenStream.from_buffer(sample_program())
+    start, stop = stream.token_range(0)
+    assert list(stream.ids[start:stop]) == [0x0006, 0xffa2, 0x003e, 0x0000]
+    assert stream.literal(start + 2) == 10
+    assert stream.literal(start) == stream.literal(stream.token_range(4)[0] + 1) == 'A'
+    assert stream.offsets[start] == stream.line_offsets[0] + 2
@@ -0,0 +1,51 @@
+import struct
+from AmosPy.batch import main
+from AmosPy.verify import verify_buffer
+from tests.amos_samples import program, line, token, decval, sample_program, procedure_program
+
+__author__ = 'danny'
+
+
+def test_intact():
+    result = verify_buffer(procedure_program())
+    assert result.error is None and result.offset is None
+    assert result.lines == 9
+
+
+def test_unknown_token():
+    """The sample has an unknown token on its last line"""
+    data = sample_program()
+    result = verify_buffer(data)
+    assert result.lines == 5
+    assert result.offset == data.rindex(b'\x12\x34') and 'Unknown token 0x1234' in result.error
+
+
+def test_failures():
+    good = line(0, decval(1))
+    short = struct.pack('BB', 6, 0) + decval(1) + token(0) + b'\x00\x00'
+    assert verify_buffer(program(good, short)).offset == 20 + len(good) + 10
+    assert verify_buffer(program(good, short)).lines == 1
+    overrun = struct.pack('BB', 3, 0) + decval(1) + token(0)
+    assert verify_buffer(program(good, overrun)).offset == 20 + len(good) + 2
+    assert verify_buffer(program(good, good)[:-4]).error == "File ends inside the code"
+    assert verify_buffer(program(good, good)[:30]).lines == 1
+    assert verify_buffer(b'AMOS').offset == 4
+
+
+def test_negative_lengths():
+    """Negative payload lengths must be reported, not step the walk backwards"""
+    for payload in (token(0x064a, struct.pack('bb', 0, -4)), token(0x0026, struct.pack('>h', -6)),
+                    token(0x0006, struct.pack('>Hbb', 0, -4, 0))):
+        data = program(line(0, decval(1), payload))
+        result = verify_buffer(data)
+        assert result.offset == 20 + 2 + 6 and 'bad payload' in result.error
+        assert result.lines == 0
+
+
+def test_verify_cli(tmpdir, capsys):
+    tmpdir.join("a.amos").write_binary(procedure_program())
+    tmpdir.join("b.amos").write_binary(sample_program())
+    assert main(['--verify', '-j', '1', str(tmpdir)]) == 1
+    out = capsys.readouterr()[0].splitlines()
+    assert out[0].endswith("a.amos: OK, 9 lines, 23 tokens")
+    assert "b.amos: FAILED at offset" in out[1] and out[2] == "2 files, 1 failed"